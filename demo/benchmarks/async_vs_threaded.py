@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+Compares the wall time of DCAwareRunner and AsyncDCAwareRunner running
+upgrade_os over fleets of different sizes
+"""
+import argparse
+import logging
+import time
+
+from nornir.core import Nornir
+from nornir.core.plugins.connections import ConnectionPluginRegister
+from nornir.core.plugins.runners import RunnerPlugin
+
+from nornir3_demo.ext import acmeos as acmeos_api
+from nornir3_demo.plugins.connections.acmeos import POOL
+from nornir3_demo.plugins.inventory.acme import ACMEInventory
+from nornir3_demo.plugins.runners.dc_aware import DCAwareRunner
+from nornir3_demo.plugins.runners.dc_aware_async import AsyncDCAwareRunner
+from nornir3_demo.plugins.tasks import acmeos, acmeos_async
+from nornir3_demo.plugins.tasks.facts_cache import FACTS
+
+
+def bench(runner: RunnerPlugin, task: object, num_hosts: int) -> float:
+    # every run starts with the same cold state, otherwise the facts cached
+    # and the devices upgraded by a run would make the next one look faster
+    FACTS.clear()
+    POOL.clear()
+
+    # leaf pairs spread across 8 sites
+    inventory = ACMEInventory(topology={"dev_types": {"leaf": num_hosts // 8}}).load()
+    nr = Nornir(inventory=inventory, runner=runner)
+    start = time.perf_counter()
+    nr.run(task=task, version="5.3.1")
+    elapsed = time.perf_counter() - start
+    nr.close_connections()
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--threads", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=50000)
+    parser.add_argument("--latency-scale", type=float, default=0.01)
+    args = parser.parse_args()
+
+    # failed hosts are expected, we don't want their tracebacks in the output
+    logging.basicConfig(level=logging.CRITICAL)
+    acmeos_api.LATENCY_SCALE = args.latency_scale
+    ConnectionPluginRegister.auto_register()
+
+    print(f"{'hosts':>8} {'threaded':>10} {'asyncio':>10}")
+    for size in args.sizes:
+        threaded = bench(DCAwareRunner(args.threads), acmeos.upgrade_os, size)
+        asynchronous = bench(
+            AsyncDCAwareRunner(args.concurrency), acmeos_async.upgrade_os, size
+        )
+        print(f"{size:>8} {threaded:>9.2f}s {asynchronous:>9.2f}s")
+
+
+if __name__ == "__main__":
+    main()
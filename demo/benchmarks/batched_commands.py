@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Compares the time each host takes to gather its facts and to run a checked
+upgrade sending one command per round-trip versus pipelining them with
+AcmeOSAPI.batch
+"""
+import argparse
+import logging
+import statistics
+import threading
+import time
+from typing import Any, Dict, List
+
+from nornir.core import Nornir
+from nornir.core.inventory import Host
+from nornir.core.plugins.connections import ConnectionPluginRegister
+from nornir.core.task import AggregatedResult, MultiResult, Result, Task
+
+from nornir3_demo.ext import acmeos as acmeos_api
+from nornir3_demo.plugins.connections.acmeos import POOL
+from nornir3_demo.plugins.inventory.acme import ACMEInventory
+from nornir3_demo.plugins.runners.dc_aware import DCAwareRunner
+from nornir3_demo.plugins.tasks import acmeos
+from nornir3_demo.plugins.tasks.facts_cache import FACTS
+
+
+class HostTimer:
+    """
+    Processor measuring how long each host takes
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.started: Dict[str, float] = {}
+        self.durations: List[float] = []
+
+    def task_started(self, task: Task) -> None:
+        pass
+
+    def task_completed(self, task: Task, result: AggregatedResult) -> None:
+        pass
+
+    def task_instance_started(self, task: Task, host: Host) -> None:
+        with self.lock:
+            self.started[host.name] = time.perf_counter()
+
+    def task_instance_completed(
+        self, task: Task, host: Host, results: MultiResult
+    ) -> None:
+        with self.lock:
+            self.durations.append(time.perf_counter() - self.started[host.name])
+
+    def subtask_instance_started(self, task: Task, host: Host) -> None:
+        pass
+
+    def subtask_instance_completed(
+        self, task: Task, host: Host, result: MultiResult
+    ) -> None:
+        pass
+
+
+def get_facts_sequential(task: Task) -> Result:
+    version = task.run(task=acmeos.get_version).result
+    cpu_ram = task.run(task=acmeos.get_cpu_ram).result
+    return Result(host=task.host, result={"version": version, "cpu_ram": cpu_ram})
+
+
+def upgrade_os_checked_sequential(task: Task, version: str) -> Result:
+    facts: Any = task.run(task=get_facts_sequential).result
+    if facts["version"]["full_version"] == version:
+        return Result(host=task.host, result="nothing to do!!!")
+    task.run(task=acmeos.install_os_version, version=version)
+    return Result(host=task.host, changed=True, result="success!!!")
+
+
+def bench(num_hosts: int, task: Any, **kwargs: Any) -> List[float]:
+    # every run starts with the same cold state, otherwise the facts cached
+    # and the devices upgraded by a run would make the next one look faster
+    FACTS.clear()
+    POOL.clear()
+
+    inventory = ACMEInventory(topology={"dev_types": {"leaf": num_hosts // 8}}).load()
+    timer = HostTimer()
+    # enough workers so hosts don't wait for each other
+    nr = Nornir(inventory=inventory, runner=DCAwareRunner(num_hosts))
+    nr.with_processors([timer]).run(task=task, **kwargs)
+    nr.close_connections()
+    return timer.durations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hosts", type=int, default=800)
+    parser.add_argument("--latency-scale", type=float, default=0.1)
+    args = parser.parse_args()
+
+    # failed hosts are expected, we don't want their tracebacks in the output
+    logging.basicConfig(level=logging.CRITICAL)
+    acmeos_api.LATENCY_SCALE = args.latency_scale
+    ConnectionPluginRegister.auto_register()
+
+    workflows = [
+        ("get_facts", get_facts_sequential, acmeos.get_facts, {}),
+        (
+            "upgrade_os_checked",
+            upgrade_os_checked_sequential,
+            acmeos.upgrade_os_checked,
+            {"version": "5.3.1"},
+        ),
+    ]
+
+    print(f"{'workflow':>20} {'mode':>10} {'mean':>8} {'p95':>8}")
+    for name, sequential, batched, kwargs in workflows:
+        for mode, task in (("sequential", sequential), ("batched", batched)):
+            durations = bench(args.hosts, task, **kwargs)
+            mean = statistics.mean(durations)
+            p95 = sorted(durations)[int(len(durations) * 0.95)]
+            print(f"{name:>20} {mode:>10} {mean:>7.3f}s {p95:>7.3f}s")
+
+
+if __name__ == "__main__":
+    main()
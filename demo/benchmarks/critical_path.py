@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""
+Simulates upgrade_os over a fleet with the latency model of ext.acmeos and
+compares the makespan of DCAwareRunner's scheduler when it starts the device
+groups in order and when it starts first the ones with more work left.
+Nothing sleeps, the durations are added to a simulated clock
+"""
+import argparse
+import heapq
+import itertools
+import random
+from typing import Dict, List, Optional, Tuple
+
+from nornir.core.inventory import Host
+
+from nornir3_demo.ext import acmeos as acmeos_api
+from nornir3_demo.plugins.inventory.acme import ACMEInventory
+from nornir3_demo.plugins.runners.critical_path import LatencyHistory
+from nornir3_demo.plugins.runners.dc_aware import get_group_name, sort_hosts
+
+
+def simulate(
+    hosts: List[Host],
+    durations: Dict[str, float],
+    num_workers: int,
+    history: Optional[LatencyHistory] = None,
+) -> float:
+    """
+    Runs the scheduler of DCAwareRunner the same way the runner does and
+    returns the simulated time when the last host finished. If a history is
+    given the groups are ordered with it and it learns from every host
+    """
+    root = sort_hosts(hosts, history=history)
+    clock = 0.0
+    # hosts in progress sorted by the time they finish
+    running: List[Tuple[float, int, Host]] = []
+    counter = itertools.count()
+    while True:
+        for host in root.batch():
+            finish = clock + durations[host.name]
+            heapq.heappush(running, (finish, next(counter), host))
+            if len(running) >= num_workers:
+                break
+        if not running:
+            return clock
+        clock, _, host = heapq.heappop(running)
+        if history is not None:
+            history.record(host, durations[host.name])
+        root.complete(host)
+
+
+def lower_bound(hosts: List[Host], durations: Dict[str, float], workers: int) -> float:
+    """
+    No schedule can beat the longest group nor the total work split evenly
+    """
+    groups: Dict[str, float] = {}
+    for host in hosts:
+        group = get_group_name(host)
+        groups[group] = groups.get(group, 0.0) + durations[host.name]
+    return max(max(groups.values()), sum(durations.values()) / workers)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sites", type=int, default=8)
+    parser.add_argument("--edges", type=int, default=2)
+    parser.add_argument("--spines", type=int, default=16)
+    parser.add_argument("--leaves", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[25, 50, 100, 200])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    topology = {
+        "sites": args.sites,
+        "dev_types": {"edge": args.edges, "spine": args.spines, "leaf": args.leaves},
+    }
+    hosts = list(ACMEInventory(topology=topology).load().hosts.values())
+
+    # upgrade_os pays a round-trip to read the version and another one to
+    # install the image, we draw the durations once so both orderings see
+    # the same fleet
+    random.seed(args.seed)
+    acmeos_api.LATENCY_SCALE = 1.0
+    durations = {h.name: acmeos_api.latency() + acmeos_api.latency() for h in hosts}
+
+    # a previous run of the fleet is where the history comes from
+    history = LatencyHistory()
+    simulate(hosts, durations, args.workers[0], history)
+
+    print(f"{len(hosts)} hosts")
+    print(f"{'workers':>8} {'fifo':>10} {'critical':>10} {'bound':>10} {'speedup':>8}")
+    for workers in args.workers:
+        fifo = simulate(hosts, durations, workers)
+        critical = simulate(hosts, durations, workers, history)
+        bound = lower_bound(hosts, durations, workers)
+        print(
+            f"{workers:>8} {fifo:>9.1f}s {critical:>9.1f}s {bound:>9.1f}s "
+            f"{fifo / critical:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Measures how long it takes to load the ACMEInventory with and without
+the inventory cache for fleets of different sizes
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import Callable
+
+from nornir3_demo.plugins.inventory import acme
+from nornir3_demo.plugins.inventory.acme import ACMEInventory
+
+
+def timeit(f: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(
+        f"{'hosts':>8} {'no cache':>10} {'cold':>10} {'snapshot':>10} "
+        f"{'warm':>10} {'warm/site':>10}"
+    )
+    for size in args.sizes:
+        # 100 sites with 2 edge, 4 spine and as many leaves as needed
+        topology = {
+            "sites": 100,
+            "dev_types": {"edge": 2, "spine": 4, "leaf": size // 100 - 6},
+        }
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            snapshot = os.path.join(tmpdir, "inventory.pickle")
+
+            no_cache = timeit(ACMEInventory(topology=topology).load)
+
+            acme.CACHES.clear()
+            cold = timeit(
+                ACMEInventory(
+                    cache_ttl=300, cache_snapshot=snapshot, topology=topology
+                ).load
+            )
+
+            # a new process would start with an empty cache but with the snapshot
+            acme.CACHES.clear()
+            from_snapshot = timeit(
+                ACMEInventory(
+                    cache_ttl=300, cache_snapshot=snapshot, topology=topology
+                ).load
+            )
+
+            warm = timeit(ACMEInventory(cache_ttl=300, topology=topology).load)
+            warm_site = timeit(
+                ACMEInventory(
+                    filter_sites=["site000"], cache_ttl=300, topology=topology
+                ).load
+            )
+
+        print(
+            f"{size:>8} {no_cache:>9.3f}s {cold:>9.3f}s {from_snapshot:>9.3f}s "
+            f"{warm:>9.3f}s {warm_site:>9.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
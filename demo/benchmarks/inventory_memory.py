@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Compares the peak memory needed to build the inventory from the full
+backend response against building it streaming one host at a time. The
+index ACMEInventory builds as it goes is measured on its own as it's not
+part of either approach
+"""
+import argparse
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from nornir.core.inventory import Groups, Host, Hosts, ParentGroups
+
+from nornir3_demo.ext.inventory import ACMEAPI
+from nornir3_demo.plugins.inventory.acme import (
+    ACMEInventory,
+    build_host,
+    build_site_group,
+)
+
+
+def peak(f: Callable[[], object]) -> float:
+    tracemalloc.start()
+    # we keep the result alive until we take the measure
+    result = f()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak / 1024 / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    args = parser.parse_args()
+
+    print(
+        f"{'hosts':>8} {'nested':>10} {'streaming':>10} {'indexed':>10} {'index':>10}"
+    )
+    for size in args.sizes:
+        topology: Dict[str, Any] = {
+            "sites": 100,
+            "dev_types": {"edge": 2, "spine": 4, "leaf": size // 100 - 6},
+        }
+
+        def nested() -> Hosts:
+            # what ACMEInventory.load used to do
+            hosts = Hosts()
+            groups = Groups()
+            for site, site_data in ACMEAPI(**topology).get().items():
+                groups[site] = build_site_group(site)
+                for hostname, host_data in site_data.items():
+                    hosts[hostname] = Host(
+                        name=hostname,
+                        hostname=hostname,
+                        platform=host_data.pop("platform"),
+                        groups=ParentGroups([groups[site]]),
+                        data={"site": site, **host_data},
+                    )
+            return hosts
+
+        def streaming() -> Hosts:
+            # what ACMEInventory.load does without the index
+            hosts = Hosts()
+            groups = Groups()
+            for site, hostname, host_data in ACMEAPI(**topology).hosts():
+                group = groups.get(site)
+                if group is None:
+                    group = groups[site] = build_site_group(site)
+                hosts[hostname] = build_host(group, hostname, host_data)
+            return hosts
+
+        indexed = ACMEInventory(topology=topology).load
+
+        nested_peak = peak(nested)
+        streaming_peak = peak(streaming)
+        indexed_peak = peak(indexed)
+        print(
+            f"{size:>8} {nested_peak:>8.1f}MB {streaming_peak:>8.1f}MB "
+            f"{indexed_peak:>8.1f}MB {indexed_peak - streaming_peak:>8.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
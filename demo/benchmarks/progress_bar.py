@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Measures the throughput of DCAwareRunner without a progress bar, with a
+ProgressBar updated from the workers and with one refreshed by its own thread
+"""
+import argparse
+import io
+import logging
+import time
+from typing import Any, List
+
+from nornir.core import Nornir
+from nornir.core.plugins.connections import ConnectionPluginRegister
+
+from rich.console import Console
+
+from nornir3_demo.ext import acmeos as acmeos_api
+from nornir3_demo.plugins.inventory.acme import ACMEInventory
+from nornir3_demo.plugins.processors.rich import ProgressBar
+from nornir3_demo.plugins.runners.dc_aware import DCAwareRunner
+from nornir3_demo.plugins.tasks import acmeos
+
+
+def bench(num_hosts: int, num_workers: int, mode: str) -> float:
+    inventory = ACMEInventory(topology={"dev_types": {"leaf": num_hosts // 8}}).load()
+    nr = Nornir(inventory=inventory, runner=DCAwareRunner(num_workers))
+
+    processors: List[Any] = []
+    if mode != "none":
+        # we draw the bars as if we had a terminal but we throw them away
+        console = Console(file=io.StringIO(), force_terminal=True, width=120)
+        processors.append(
+            ProgressBar(
+                len(inventory.hosts),
+                refresh_per_second=None if mode == "workers" else 10,
+                per_site=mode == "refresher+sites",
+                console=console,
+            )
+        )
+
+    start = time.perf_counter()
+    nr.with_processors(processors).run(task=acmeos.upgrade_os, version="5.3.2")
+    return len(inventory.hosts) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hosts", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=100)
+    parser.add_argument("--latency-scale", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # failed hosts are expected, we don't want their tracebacks in the output
+    logging.basicConfig(level=logging.CRITICAL)
+    acmeos_api.LATENCY_SCALE = args.latency_scale
+    ConnectionPluginRegister.auto_register()
+
+    print(f"{'progress bar':>16} {'hosts/s':>10}")
+    for mode in ("none", "workers", "refresher", "refresher+sites"):
+        # we keep the best run as the noise only makes things slower
+        throughput = max(
+            bench(args.hosts, args.workers, mode) for _ in range(args.repeat)
+        )
+        print(f"{mode:>16} {throughput:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from nornir.core.inventory import Host
+from nornir.core.task import AggregatedResult, MultiResult, Task
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobProgress:
+    """
+    Processor that keeps track of the hosts that finished so we can report
+    the progress of a job while it's running
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.completed: List[str] = []
+        self.failed: List[str] = []
+
+    def task_started(self, task: Task) -> None:
+        pass
+
+    def task_completed(self, task: Task, result: AggregatedResult) -> None:
+        pass
+
+    def task_instance_started(self, task: Task, host: Host) -> None:
+        pass
+
+    def task_instance_completed(
+        self, task: Task, host: Host, results: MultiResult
+    ) -> None:
+        with self.lock:
+            if results.failed:
+                self.failed.append(host.name)
+            else:
+                self.completed.append(host.name)
+
+    def subtask_instance_started(self, task: Task, host: Host) -> None:
+        pass
+
+    def subtask_instance_completed(
+        self, task: Task, host: Host, result: MultiResult
+    ) -> None:
+        pass
+
+    def report(self) -> Dict[str, List[str]]:
+        # skipped hosts are only known once the runner finishes
+        with self.lock:
+            return {
+                "failed": list(self.failed),
+                "skipped": [],
+                "completed": list(self.completed),
+            }
+
+
+class JobStream:
+    """
+    Processor that pushes an event per host into a bounded queue as soon as
+    the host finishes so a client can consume the results while the job runs.
+
+    When the queue is full the runner waits for the client to catch up, this
+    way neither side buffers the whole result. If the client goes away we
+    stop queueing events so the job isn't blocked forever.
+    """
+
+    def __init__(self, maxsize: int = 100) -> None:
+        self.queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize)
+        self.closed = threading.Event()
+
+    def put(self, event: Optional[Dict[str, Any]]) -> None:
+        while not self.closed.is_set():
+            try:
+                self.queue.put(event, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self, job: "Job") -> None:
+        """
+        Sends the final status of the job and tells the consumer we are done.
+        Completed and failed hosts were already sent so we only add the
+        skipped ones, which never reach task_instance_completed
+        """
+        data = job.dict()
+        self.put(
+            {
+                "event": "job",
+                "id": job.id,
+                "status": job.status,
+                "error": job.error,
+                "total": job.total,
+                "done": data["done"],
+                "skipped": data["result"]["skipped"],
+            }
+        )
+        self.put(None)
+
+    def close(self) -> None:
+        """
+        Called by the consumer when it's not interested in more events
+        """
+        self.closed.set()
+        # we drain the queue in case the producer is waiting for a slot
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def events(self) -> Iterator[Dict[str, Any]]:
+        try:
+            while True:
+                event = self.queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.close()
+
+    def task_started(self, task: Task) -> None:
+        pass
+
+    def task_completed(self, task: Task, result: AggregatedResult) -> None:
+        pass
+
+    def task_instance_started(self, task: Task, host: Host) -> None:
+        pass
+
+    def task_instance_completed(
+        self, task: Task, host: Host, results: MultiResult
+    ) -> None:
+        exception = results[0].exception if results else None
+        self.put(
+            {
+                "event": "host",
+                "host": host.name,
+                "site": host.data.get("site"),
+                "failed": results.failed,
+                "changed": results.changed,
+                "error": str(exception) if exception else None,
+            }
+        )
+
+    def subtask_instance_started(self, task: Task, host: Host) -> None:
+        pass
+
+    def subtask_instance_completed(
+        self, task: Task, host: Host, result: MultiResult
+    ) -> None:
+        pass
+
+
+class Job:
+    def __init__(
+        self, name: str, params: Dict[str, Any], stream: Optional[JobStream] = None
+    ) -> None:
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.params = params
+        self.status = "queued"
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.total: Optional[int] = None
+        self.progress = JobProgress()
+        self.stream = stream
+        self.result: Optional[Dict[str, List[str]]] = None
+        self.error: Optional[str] = None
+
+    def processors(self) -> List[Any]:
+        """
+        Processors the job function has to add to the run to report its progress
+        """
+        if self.stream is None:
+            return [self.progress]
+        return [self.progress, self.stream]
+
+    def dict(self) -> Dict[str, Any]:
+        # until the job finishes we only know which hosts completed or failed
+        result = self.result if self.result is not None else self.progress.report()
+        return {
+            "id": self.id,
+            "name": self.name,
+            "params": self.params,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "total": self.total,
+            "done": len(result["completed"]) + len(result["failed"]),
+            "result": result,
+            "error": self.error,
+        }
+
+
+JobFunction = Callable[[Job], Dict[str, List[str]]]
+
+
+class JobManager:
+    """
+    Runs jobs in the background
+
+    Arguments:
+        max_running: number of jobs that can run at the same time
+        max_queued: number of jobs that can wait for a slot, when the queue is full
+            submitting a new job raises QueueFull
+        max_finished: number of finished jobs we remember
+    """
+
+    def __init__(
+        self, max_running: int = 2, max_queued: int = 10, max_finished: int = 100
+    ) -> None:
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.pool = ThreadPoolExecutor(max_running)
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Job] = {}
+        self.finished: "OrderedDict[str, None]" = OrderedDict()
+        self.pending = 0
+
+    def submit(
+        self,
+        name: str,
+        params: Dict[str, Any],
+        func: JobFunction,
+        stream: Optional[JobStream] = None,
+    ) -> Job:
+        with self.lock:
+            if self.pending >= self.max_running + self.max_queued:
+                raise QueueFull(f"there are already {self.pending} jobs pending")
+            self.pending += 1
+            job = Job(name, params, stream)
+            self.jobs[job.id] = job
+
+        self.pool.submit(self._run, job, func)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job: Job, func: JobFunction) -> None:
+        job.status = "running"
+        job.started = time.time()
+        try:
+            job.result = func(job)
+            job.status = "completed"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        job.finished = time.time()
+        if job.stream is not None:
+            job.stream.finish(job)
+
+        with self.lock:
+            self.pending -= 1
+            self.finished[job.id] = None
+            while len(self.finished) > self.max_finished:
+                job_id, _ = self.finished.popitem(last=False)
+                del self.jobs[job_id]
@@ -1,8 +1,9 @@
 #!/usr/bin/env python
 
+import itertools
 import json
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
 from nornir import InitNornir
 from nornir.core import Nornir
@@ -13,6 +14,8 @@ from nornir3_demo.plugins.processors.prometheus import Prometheus
 from nornir3_demo.plugins.processors.logger import Logger
 from nornir3_demo.plugins.runners.dc_aware import DCAwareRunner
 
+from jobs import Job, JobManager, JobStream, QueueFull
+
 from flask import Flask, Response, request
 
 import prometheus_client
@@ -24,6 +27,9 @@ app = Flask(__name__)
 
 prometheus = Prometheus()
 
+# upgrades run in the background, we don't want to block the http workers
+jobs = JobManager(max_running=2, max_queued=10)
+
 
 @app.route("/swagger/")
 def swagger() -> Response:
@@ -52,9 +58,12 @@ def calculate_result(
 
 
 def get_nornir(
-    filter_sites: Optional[List[str]], filter_dev_types: Optional[List[str]]
+    filter_sites: Optional[List[str]],
+    filter_dev_types: Optional[List[str]],
+    extra_processors: Optional[List[Any]] = None,
 ) -> Nornir:
     processors = [prometheus, Logger("orchestrator.log", log_level=logging.INFO)]
+    processors.extend(extra_processors or [])
 
     return InitNornir(
         inventory={
@@ -62,20 +71,27 @@ def get_nornir(
             "options": {
                 "filter_sites": filter_sites,
                 "filter_dev_types": filter_dev_types,
+                # we serve the inventory from memory and refresh it every 5 minutes
+                "cache_ttl": 300,
             },
         },
-        runner={"plugin": "DCAwareRunner", "options": {"num_workers": 100}},
+        runner={
+            "plugin": "DCAwareRunner",
+            # we only report the status of each host so we don't need to keep
+            # the full results of the whole fleet in memory
+            "options": {"num_workers": 100, "retention": "compact"},
+        },
     ).with_processors(processors)
 
 
-def respond(raw: Any) -> Response:
+def respond(raw: Any, status: int = 200) -> Response:
     """
     This methods serializes the response into json and
     set the appropiate HTTP headers
     """
     return Response(
         json.dumps(raw),
-        status=200,
+        status=status,
         headers={
             "Content-Type": "application/json",
             "Access-Control-Allow-Origin": "*",  # this is certainly not good in prod!!!
@@ -90,18 +106,85 @@ def metrics() -> Response:
     return Response(prometheus_client.generate_latest(), mimetype=CONTENT_TYPE_LATEST)
 
 
-@app.route("/upgrade-os/", methods=["POST"])
-def upgrade_os_endpoint() -> Response:
+def upgrade_os(job: Job) -> Dict[str, List[str]]:
     nr = get_nornir(
-        request.json.get("filter_sites"), request.json.get("filter_dev_types")
+        job.params["filter_sites"], job.params["filter_dev_types"], job.processors()
     )
-    version = request.json["version"]
+    job.total = len(nr.inventory.hosts)
+
+    try:
+        results = nr.run(task=acmeos.upgrade_os, version=job.params["version"])
+    finally:
+        # we hand the connections back to the pool so the next job can reuse
+        # them, even if the run blew up
+        for host in nr.inventory.hosts.values():
+            host.close_connections()
+
+    return calculate_result(nr.runner, results)
+
+
+def upgrade_os_params() -> Dict[str, Any]:
+    return {
+        "filter_sites": request.json.get("filter_sites"),
+        "filter_dev_types": request.json.get("filter_dev_types"),
+        "version": request.json["version"],
+    }
+
+
+@app.route("/upgrade-os/", methods=["POST"])
+def upgrade_os_endpoint() -> Response:
+    try:
+        job = jobs.submit("upgrade_os", upgrade_os_params(), upgrade_os)
+    except QueueFull as e:
+        return respond({"error": str(e)}, status=429)
 
-    results = nr.run(task=acmeos.upgrade_os, version=version)
+    return respond(job.dict(), status=202)
+
+
+def stream_events(job: Job, sse: bool) -> Iterator[str]:
+    """
+    Serializes the events of the job either as newline delimited json
+    or as server-sent events
+    """
+    assert job.stream is not None
+    first = {"event": "job", "id": job.id, "status": job.status}
+    for event in itertools.chain([first], job.stream.events()):
+        if sse:
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        else:
+            yield f"{json.dumps(event)}\n"
+
+
+@app.route("/upgrade-os/stream/", methods=["POST"])
+def upgrade_os_stream_endpoint() -> Response:
+    """
+    Same as /upgrade-os/ but the response streams an event per host as they
+    finish. Use ``Accept: text/event-stream`` to get server-sent events instead
+    of newline delimited json
+    """
+    stream = JobStream()
+    try:
+        job = jobs.submit("upgrade_os", upgrade_os_params(), upgrade_os, stream)
+    except QueueFull as e:
+        return respond({"error": str(e)}, status=429)
+
+    sse = request.accept_mimetypes.best == "text/event-stream"
+    return Response(
+        stream_events(job, sse),
+        headers={
+            "Content-Type": "text/event-stream" if sse else "application/x-ndjson",
+            "Cache-Control": "no-cache",
+            "Access-Control-Allow-Origin": "*",
+        },
+    )
 
-    report = calculate_result(nr.runner, results)
 
-    return respond(report)
+@app.route("/jobs/<job_id>/")
+def job_endpoint(job_id: str) -> Response:
+    job = jobs.get(job_id)
+    if job is None:
+        return respond({"error": f"job {job_id} not found"}, status=404)
+    return respond(job.dict())
 
 
 if __name__ == "__main__":
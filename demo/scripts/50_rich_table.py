@@ -16,4 +16,5 @@ nr = InitNornir(
 )
 
 results = nr.run(task=gather_info)
-rich_table(results)
+# a table per host with the version and cpu/ram each subtask gathered
+rich_table(results, detailed=True)
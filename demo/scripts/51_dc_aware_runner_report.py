@@ -5,9 +5,7 @@ from nornir import InitNornir
 from nornir3_demo.plugins.processors.rich import ProgressBar
 from nornir3_demo.plugins.runners.dc_aware import DCAwareRunner
 from nornir3_demo.plugins.tasks import acmeos
-from nornir3_demo.plugins.functions.rich import rich_dc_aware_report
-
-from rich.console import Console
+from nornir3_demo.plugins.functions.rich import print_dc_aware_report
 
 nr = InitNornir(inventory={"plugin": "ACMEInventory"})
 
@@ -19,5 +17,5 @@ nr = nr.with_processors([ProgressBar(total_hosts)]).with_runner(dc_runner)
 
 nr.run(task=acmeos.upgrade_os, version="5.3.1")
 
-table = rich_dc_aware_report(dc_runner)
-Console().print("\n", table)
+# the report is printed as it is generated so it shows up right away
+print_dc_aware_report(dc_runner)
@@ -1,23 +1,79 @@
+import asyncio
 import time
 import random
 
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
 class ConnectionException(Exception):
     pass
 
 
-def maybe_fail(max_latency: int, chance_of_error: int = 1000) -> None:
-    # simulate latency
-    time.sleep(random.randint(1, 200) / 100)
+class BatchException(ConnectionException):
+    """
+    Raised when a command of a batch fails, commands after it are not executed
+
+    Attributes:
+        results: results of the commands that ran before the failure
+    """
+
+    def __init__(self, message: str, results: List[Any]) -> None:
+        super().__init__(message)
+        self.results = results
+
+
+# multiplier applied to the simulated latency, benchmarks can lower it
+# to exercise large fleets in a reasonable amount of time
+LATENCY_SCALE = 1.0
+
+
+# time the device needs to process each command, this is small compared to
+# the round-trip so pipelining several commands saves most of the latency
+COMMAND_LATENCY = 0.05
 
+# chance_of_error of each command, see maybe_raise
+COMMAND_ERRORS = {
+    "get_version": 1000,
+    "get_cpu_ram": 1000,
+    "install_os_version": 500,
+}
+
+# (command name, keyword arguments)
+Command = Tuple[str, Dict[str, Any]]
+
+
+def latency() -> float:
+    return random.randint(1, 200) / 100 * LATENCY_SCALE
+
+
+def batch_latency(num_commands: int) -> float:
+    # a batch pays the round-trip once but the device processes every command
+    return latency() + (num_commands - 1) * COMMAND_LATENCY * LATENCY_SCALE
+
+
+def maybe_raise(chance_of_error: int) -> None:
     #  simulate random network errors
     if random.randint(1, chance_of_error) < 10:
         raise ConnectionException("problem communicating with device")
 
 
-class AcmeOSAPI:
+def maybe_fail(max_latency: int, chance_of_error: int = 1000) -> None:
+    # simulate latency
+    time.sleep(latency())
+    maybe_raise(chance_of_error)
+
+
+async def async_maybe_fail(max_latency: int, chance_of_error: int = 1000) -> None:
+    # same as maybe_fail but yielding to the event loop instead of blocking a thread
+    await asyncio.sleep(latency())
+    maybe_raise(chance_of_error)
+
+
+class BaseAcmeOSAPI:
+    """
+    State and parsing logic shared by the blocking and the asyncio drivers
+    """
+
     def __init__(
         self,
         hostname: Optional[str],
@@ -34,12 +90,6 @@ class AcmeOSAPI:
         revision = random.randint(0, 9) if minor_version != 4 else 1
         self.version = f"5.{minor_version}.{revision}"
 
-    def open(self) -> None:
-        maybe_fail(1)
-
-    def close(self) -> None:
-        maybe_fail(1)
-
     def _process_version(self, version: str) -> Dict[str, str]:
         ver = version.split(".")
         if len(ver) != 3:
@@ -52,21 +102,100 @@ class AcmeOSAPI:
             "full_version": version,
         }
 
+    def _cpu_ram(self) -> Dict[str, int]:
+        return {
+            "cpu": random.randint(10, 50),
+            "ram_total": 4096,
+            "ram_used": random.randint(1024, 2048),
+        }
+
+    def _install(self, version: str) -> Dict[str, str]:
+        result = self._process_version(version)
+        self.version = version
+        return result
+
+    def _execute(self, commands: List[Command]) -> List[Any]:
+        """
+        Runs the commands of a batch in order once the round-trip is paid
+        """
+        handlers: Dict[str, Callable[..., Any]] = {
+            "get_version": lambda: self._process_version(self.version),
+            "get_cpu_ram": self._cpu_ram,
+            "install_os_version": self._install,
+        }
+        # we check all the commands first so a typo doesn't leave the batch
+        # half applied
+        unknown = [name for name, _ in commands if name not in handlers]
+        if unknown:
+            raise ValueError(f"unknown command {', '.join(unknown)}")
+
+        results: List[Any] = []
+        for name, kwargs in commands:
+            try:
+                maybe_raise(COMMAND_ERRORS[name])
+                results.append(handlers[name](**kwargs))
+            except ConnectionException as e:
+                raise BatchException(f"{name} failed: {e}", results)
+        return results
+
+
+class AcmeOSAPI(BaseAcmeOSAPI):
+    def open(self) -> None:
+        maybe_fail(1)
+
+    def close(self) -> None:
+        maybe_fail(1)
+
     def get_version(self) -> Dict[str, str]:
         maybe_fail(10)
         return self._process_version(self.version)
 
     def get_cpu_ram(self) -> Dict[str, int]:
         maybe_fail(10)
-        return {
-            "cpu": random.randint(10, 50),
-            "ram_total": 4096,
-            "ram_used": random.randint(1024, 2048),
-        }
+        return self._cpu_ram()
 
     def install_os_version(self, version: str) -> Dict[str, str]:
         maybe_fail(100, 500)
+        return self._install(version)
 
-        result = self._process_version(version)
-        self.version = version
-        return result
+    def batch(self, commands: List[Command]) -> List[Any]:
+        """
+        Sends several commands in a single round-trip and returns their
+        results in the same order, for instance::
+
+            device.batch([("get_version", {}), ("get_cpu_ram", {})])
+
+        If a command fails the rest are not executed and BatchException is
+        raised with the results of the commands that succeeded
+        """
+        time.sleep(batch_latency(len(commands)))
+        return self._execute(commands)
+
+
+class AsyncAcmeOSAPI(BaseAcmeOSAPI):
+    """
+    Same API as AcmeOSAPI but every call to the device is a coroutine so
+    a single event loop can drive many devices at the same time
+    """
+
+    async def open(self) -> None:
+        await async_maybe_fail(1)
+
+    async def close(self) -> None:
+        await async_maybe_fail(1)
+
+    async def get_version(self) -> Dict[str, str]:
+        await async_maybe_fail(10)
+        return self._process_version(self.version)
+
+    async def get_cpu_ram(self) -> Dict[str, int]:
+        await async_maybe_fail(10)
+        return self._cpu_ram()
+
+    async def install_os_version(self, version: str) -> Dict[str, str]:
+        await async_maybe_fail(100, 500)
+        return self._install(version)
+
+    async def batch(self, commands: List[Command]) -> List[Any]:
+        await asyncio.sleep(batch_latency(len(commands)))
+        return self._execute(commands)
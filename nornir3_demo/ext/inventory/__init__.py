@@ -1,4 +1,6 @@
-from typing import Dict, List, Optional
+import math
+import random
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 
 dev_types = {
@@ -8,55 +10,146 @@ dev_types = {
 }
 sites = ["mercury", "venus", "earth", "mars", "jupyter", "uranus", "saturn", "neptune"]
 
+# ACMEAPI's arguments shadow the names above
+default_dev_types = dev_types
+default_sites = sites
+
+# first rack of each dev_type, types with more racks than fit before the
+# next one push it further, see ACMEAPI.get_rack_offsets
+rack_offsets = {
+    "edge": 10,
+    "spine": 20,
+    "leaf": 100,
+}
+
 
 InventoryDataType = Dict[str, Dict[str, Dict[str, str]]]
+HostRecord = Tuple[str, str, Dict[str, str]]
 
 
 class ACMEAPI:
+    """
+    Simulates the inventory backend. By default it returns the same fleet
+    as always but the topology can be changed to model bigger fleets
+
+    Arguments:
+        sites: list of sites or number of sites to generate
+        dev_types: number of devices of each type per site
+        hosts_per_rack: how many devices of the same type share a rack
+        variance: if set, the number of devices of each type in each site
+            will vary randomly up to this fraction
+        seed: seed used to compute the variance so results are reproducible
+    """
+
+    def __init__(
+        self,
+        sites: Union[None, int, List[str]] = None,
+        dev_types: Optional[Dict[str, int]] = None,
+        hosts_per_rack: int = 2,
+        variance: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        if isinstance(sites, int):
+            self.sites = [f"site{i:03}" for i in range(sites)]
+        else:
+            self.sites = sites or default_sites
+        self.dev_types = dev_types or default_dev_types
+        self.hosts_per_rack = hosts_per_rack
+        self.variance = variance
+        self.seed = seed
+
     @staticmethod
-    def get_rack(i: int, dev_type: str) -> str:
-        offset_map = {
-            "edge": 10,
-            "spine": 20,
-            "leaf": 100,
-        }
-        rack_num = offset_map[dev_type] + i // 2
+    def get_rack_offsets(
+        counts: Dict[str, int], hosts_per_rack: int = 2
+    ) -> Dict[str, int]:
+        """
+        Returns the first rack of each dev_type in a site with ``counts``
+        devices of each type so the racks of different types never overlap
+        """
+        offsets = {}
+        next_free = 0
+        for dev_type, num in counts.items():
+            offset = max(rack_offsets.get(dev_type, 0), next_free)
+            offsets[dev_type] = offset
+            next_free = offset + math.ceil(num / hosts_per_rack)
+        return offsets
+
+    @staticmethod
+    def get_rack(
+        i: int,
+        dev_type: str,
+        hosts_per_rack: int = 2,
+        offsets: Optional[Dict[str, int]] = None,
+    ) -> str:
+        offsets = offsets if offsets is not None else rack_offsets
+        rack_num = offsets.get(dev_type, 0) + i // hosts_per_rack
         return f"{rack_num}"
 
-    def get(
+    def hosts(
         self,
         filter_sites: Optional[List[str]] = None,
         filter_dev_types: Optional[List[str]] = None,
-    ) -> InventoryDataType:
+    ) -> Iterator[HostRecord]:
         """
-        Returns something like:
-            {
-            }
+        Lazily generates a (site, hostname, data) record per host so
+        big fleets can be processed without holding all of them in memory
         """
-        result: InventoryDataType = {}
-        if filter_sites is None:
-            filter_sites = sites
-        if filter_dev_types is None:
-            filter_dev_types = [t for t in dev_types]
+        rng = random.Random(self.seed)
 
-        for site in sites:
-            if site not in filter_sites:
-                continue
+        for site in self.sites:
+            # we compute the variance and the racks before filtering so
+            # filters don't change the size or the racks of the rest of the fleet
+            counts = {}
+            for dev_type, num in self.dev_types.items():
+                if self.variance:
+                    num = round(num * (1 + rng.uniform(-1, 1) * self.variance))
+                counts[dev_type] = num
+            offsets = self.get_rack_offsets(counts, self.hosts_per_rack)
 
-            result[site] = {}
+            if filter_sites is not None and site not in filter_sites:
+                continue
 
-            for dev_type, num in dev_types.items():
-                if dev_type not in filter_dev_types:
+            for dev_type, num in counts.items():
+                if filter_dev_types is not None and dev_type not in filter_dev_types:
                     continue
 
-                for i in range(0, dev_types[dev_type]):
+                for i in range(0, num):
                     name = f"{dev_type}{i:02}.{site}"
-                    result[site][name] = {
+                    yield site, name, {
                         "platform": "acmeos",
                         "dev_type": dev_type,
-                        "rack": self.get_rack(i, dev_type),
+                        "rack": self.get_rack(
+                            i, dev_type, self.hosts_per_rack, offsets
+                        ),
                     }
 
+    def get(
+        self,
+        filter_sites: Optional[List[str]] = None,
+        filter_dev_types: Optional[List[str]] = None,
+    ) -> InventoryDataType:
+        """
+        Returns something like:
+            {
+                "earth": {
+                    "edge00.earth": {
+                        "platform": "acmeos",
+                        "dev_type": "edge",
+                        "rack": "10",
+                    },
+                    ...
+                },
+                ...
+            }
+        """
+        result: InventoryDataType = {}
+        for site in self.sites:
+            if filter_sites is None or site in filter_sites:
+                result[site] = {}
+
+        for site, name, data in self.hosts(filter_sites, filter_dev_types):
+            result[site][name] = data
+
         return result
 
 
@@ -3,10 +3,15 @@ from typing import Any, Dict, Optional
 from nornir.core.configuration import Config
 
 from nornir3_demo.ext.acmeos import AcmeOSAPI
+from nornir3_demo.plugins.connections.pool import ConnectionPool
 
 
 CONNECTION_NAME = "acmeos"
 
+# connections are shared by all the nornir objects in the process,
+# tune its settings by modifying its attributes
+POOL = ConnectionPool()
+
 
 class AcmeOS:
     def open(
@@ -19,9 +24,16 @@ class AcmeOS:
         extras: Optional[Dict[str, Any]] = None,
         configuration: Optional[Config] = None,
     ) -> None:
-        connection = AcmeOSAPI(hostname, username, password, port)
-        connection.open()
-        self.connection = connection
+        def connect() -> AcmeOSAPI:
+            connection = AcmeOSAPI(hostname, username, password, port)
+            connection.open()
+            return connection
+
+        # the inventory sets the site in the extras so the pool can enforce
+        # per site limits
+        site = (extras or {}).get("site")
+        self.connection = POOL.acquire((hostname, username, port), site, connect)
 
     def close(self) -> None:
-        self.connection.close()
+        # instead of closing the connection we hand it back to the pool
+        POOL.release(self.connection)
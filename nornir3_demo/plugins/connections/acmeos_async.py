@@ -0,0 +1,63 @@
+from typing import Any, Dict, Optional
+
+from nornir.core.configuration import Config
+from nornir.core.inventory import Host
+
+from nornir3_demo.ext.acmeos import AsyncAcmeOSAPI
+
+
+CONNECTION_NAME = "acmeos_async"
+
+
+class AsyncAcmeOS:
+    """
+    nornir opens connections synchronously so this plugin only instantiates
+    the driver, the handshake with the device happens inside the event loop
+    the first time a task calls ``get_connection``
+    """
+
+    def open(
+        self,
+        hostname: Optional[str],
+        username: Optional[str],
+        password: Optional[str],
+        port: Optional[int],
+        platform: Optional[str],
+        extras: Optional[Dict[str, Any]] = None,
+        configuration: Optional[Config] = None,
+    ) -> None:
+        self.connection = AsyncAcmeOSAPI(hostname, username, password, port)
+        self.established = False
+
+    async def establish(self) -> AsyncAcmeOSAPI:
+        if not self.established:
+            await self.connection.open()
+            self.established = True
+        return self.connection
+
+    def close(self) -> None:
+        # closing the session requires the event loop, see close_connection
+        pass
+
+    async def aclose(self) -> None:
+        if self.established:
+            self.established = False
+            await self.connection.close()
+
+
+async def get_connection(host: Host, configuration: Config) -> AsyncAcmeOSAPI:
+    """
+    Coroutine equivalent to ``host.get_connection``
+    """
+    host.get_connection(CONNECTION_NAME, configuration)
+    plugin: AsyncAcmeOS = host.connections[CONNECTION_NAME]
+    return await plugin.establish()
+
+
+async def close_connection(host: Host) -> None:
+    """
+    Coroutine equivalent to ``host.close_connection``
+    """
+    plugin: Optional[AsyncAcmeOS] = host.connections.pop(CONNECTION_NAME, None)
+    if plugin is not None:
+        await plugin.aclose()
@@ -0,0 +1,258 @@
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Callable, DefaultDict, Dict, Hashable, List, Optional, Tuple
+
+from nornir3_demo.ext.acmeos import AcmeOSAPI, ConnectionException
+
+
+class PooledConnection:
+    def __init__(self, key: Hashable, site: Optional[str], conn: AcmeOSAPI) -> None:
+        self.key = key
+        self.site = site
+        self.conn = conn
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+    def expired(self, now: float, idle_timeout: float, max_age: float) -> bool:
+        return now - self.last_used > idle_timeout or now - self.created > max_age
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of established connections so they can be reused
+    across nornir objects instead of doing a handshake every time
+
+    Arguments:
+        idle_timeout: seconds a connection can stay unused in the pool
+        max_age: seconds since it was established after which a connection is
+            not reused anymore
+        max_per_site: maximum number of connections open at the same time
+            against a site, idle or in use. When it's reached ``acquire``
+            closes the least recently used idle connection of the site to make
+            room or, if all of them are in use, waits for one to be released
+        max_idle_per_site: maximum number of idle connections kept per site,
+            when it's reached the least recently used one is evicted
+        acquire_timeout: seconds ``acquire`` waits for room in the site before
+            raising a ConnectionException
+        health_check: callable that returns False if a pooled connection
+            shouldn't be handed out anymore
+    """
+
+    def __init__(
+        self,
+        idle_timeout: float = 300,
+        max_age: float = 3600,
+        max_per_site: Optional[int] = None,
+        max_idle_per_site: Optional[int] = None,
+        acquire_timeout: float = 60,
+        health_check: Optional[Callable[[AcmeOSAPI], bool]] = None,
+    ) -> None:
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.max_per_site = max_per_site
+        self.max_idle_per_site = max_idle_per_site
+        self.acquire_timeout = acquire_timeout
+        self.health_check = health_check
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        # notified when a connection is released or closed
+        self._room = threading.Condition(self._lock)
+        # connections established per site, idle or in use
+        self._open_per_site: "Counter[Optional[str]]" = Counter()
+        self._idle: Dict[Hashable, List[PooledConnection]] = {}
+        # idle connections per site in the order they were released (LRU first)
+        self._idle_per_site: DefaultDict[
+            Optional[str], "OrderedDict[int, PooledConnection]"
+        ] = defaultdict(OrderedDict)
+        self._in_use: Dict[int, PooledConnection] = {}
+
+    def acquire(
+        self, key: Hashable, site: Optional[str], factory: Callable[[], AcmeOSAPI],
+    ) -> AcmeOSAPI:
+        """
+        Returns an idle connection for ``key`` if there is a healthy one,
+        otherwise it establishes a new one calling ``factory``
+        """
+        while True:
+            pooled, evicted = self._checkout(key, site)
+            self._close(evicted)
+            if (
+                pooled is None
+                or not self.health_check
+                or self.health_check(pooled.conn)
+            ):
+                break
+            self._evict(pooled)
+
+        if pooled is None:
+            # the room for the connection is already taken, if the factory
+            # fails we give it back and let the exception go on
+            try:
+                pooled = PooledConnection(key, site, factory())
+            except Exception:
+                with self._lock:
+                    self._closed(site)
+                raise
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+
+        pooled.last_used = time.monotonic()
+        with self._lock:
+            self._in_use[id(pooled.conn)] = pooled
+        return pooled.conn
+
+    def release(self, conn: AcmeOSAPI) -> None:
+        """
+        Hands a connection back to the pool, on the way we evict the least
+        recently used connections of the site if they expired or if the site
+        has too many idle ones
+        """
+        evicted: List[PooledConnection] = []
+        with self._lock:
+            now = time.monotonic()
+            pooled = self._in_use.pop(id(conn))
+            pooled.last_used = now
+            self._idle.setdefault(pooled.key, []).append(pooled)
+            site_idle = self._idle_per_site[pooled.site]
+            site_idle[id(pooled.conn)] = pooled
+
+            while site_idle:
+                lru = next(iter(site_idle.values()))
+                over_limit = (
+                    self.max_idle_per_site is not None
+                    and len(site_idle) > self.max_idle_per_site
+                )
+                if not over_limit and not lru.expired(
+                    now, self.idle_timeout, self.max_age
+                ):
+                    break
+                self._closed(pooled.site)
+                evicted.append(self._pop_lru(pooled.site))
+            self.evictions += len(evicted)
+            self._room.notify_all()
+
+        self._close(evicted)
+
+    def clear(self) -> None:
+        """
+        Closes all the idle connections
+        """
+        with self._lock:
+            evicted = [p for idle in self._idle.values() for p in idle]
+            for pooled in evicted:
+                self._closed(pooled.site)
+            self._idle.clear()
+            self._idle_per_site.clear()
+            self.evictions += len(evicted)
+        self._close(evicted)
+
+    def after_fork(self) -> None:
+        """
+        Forgets the connections of the parent process and replaces the locks,
+        which could be held by threads that don't exist in a forked process
+        """
+        self._lock = threading.Lock()
+        self._room = threading.Condition(self._lock)
+        self._open_per_site = Counter()
+        self._idle = {}
+        self._idle_per_site = defaultdict(OrderedDict)
+        self._in_use = {}
+
+    def _checkout(
+        self, key: Hashable, site: Optional[str]
+    ) -> Tuple[Optional[PooledConnection], List[PooledConnection]]:
+        """
+        Returns an idle connection for ``key`` or None if a new one has to be
+        established, in which case its room in the site is already taken. It
+        also returns the connections we evicted on the way so the caller can
+        close them without holding the lock
+        """
+        evicted: List[PooledConnection] = []
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                while key in self._idle:
+                    candidate = self._pop_idle(key)
+                    if not candidate.expired(now, self.idle_timeout, self.max_age):
+                        self.evictions += len(evicted)
+                        return candidate, evicted
+                    self._closed(site)
+                    evicted.append(candidate)
+
+                if (
+                    self.max_per_site is None
+                    or self._open_per_site[site] < self.max_per_site
+                ):
+                    self._open_per_site[site] += 1
+                    self.evictions += len(evicted)
+                    return None, evicted
+
+                # we make room closing an idle connection to another host of the site
+                if self._idle_per_site[site]:
+                    self._closed(site)
+                    evicted.append(self._pop_lru(site))
+                    continue
+
+                remaining = deadline - now
+                if remaining <= 0:
+                    self.evictions += len(evicted)
+                    break
+                self._room.wait(remaining)
+
+        self._close(evicted)
+        raise ConnectionException(
+            f"timed out waiting for a connection to site {site}, "
+            f"{self.max_per_site} are in use"
+        )
+
+    def _closed(self, site: Optional[str]) -> None:
+        """
+        Gives back the room of a connection, it has to be called with the lock
+        """
+        self._open_per_site[site] -= 1
+        if self._open_per_site[site] <= 0:
+            del self._open_per_site[site]
+        self._room.notify_all()
+
+    def _pop_idle(self, key: Hashable) -> PooledConnection:
+        idle = self._idle[key]
+        # we reuse the most recently used connection, it's the one less
+        # likely to be stale
+        pooled = idle.pop()
+        if not idle:
+            del self._idle[key]
+        del self._idle_per_site[pooled.site][id(pooled.conn)]
+        return pooled
+
+    def _pop_lru(self, site: Optional[str]) -> PooledConnection:
+        _, lru = self._idle_per_site[site].popitem(last=False)
+        idle = self._idle[lru.key]
+        idle.remove(lru)
+        if not idle:
+            del self._idle[lru.key]
+        return lru
+
+    def _evict(self, pooled: PooledConnection) -> None:
+        with self._lock:
+            self.evictions += 1
+            self._closed(pooled.site)
+        self._close([pooled])
+
+    def _close(self, evicted: List[PooledConnection]) -> None:
+        # their room was given back when we took them out of the pool so
+        # others can use it while we close them
+        for pooled in evicted:
+            try:
+                pooled.conn.close()
+            except ConnectionException:
+                # the connection is going away anyway
+                pass
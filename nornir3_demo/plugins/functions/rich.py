@@ -1,4 +1,20 @@
-from nornir.core.task import AggregatedResult
+from collections import Counter
+from contextlib import ExitStack
+from itertools import islice
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from nornir.core.inventory import Host
+from nornir.core.task import AggregatedResult, MultiResult
 
 from nornir3_demo.plugins.runners.dc_aware import DCAwareRunner
 
@@ -8,44 +24,280 @@ from rich.text import Text
 from rich.box import MINIMAL_DOUBLE_HEAD
 
 
-def rich_table(results: AggregatedResult) -> None:
-    console = Console()
+Row = Tuple[Any, ...]
+
+
+def _print_pages(
+    console: Console,
+    new_table: Callable[[bool], Table],
+    rows: Iterable[Row],
+    page_size: int,
+    pager: bool,
+) -> None:
+    """
+    Prints the rows in tables of ``page_size`` rows as they are generated so
+    rich never has to lay out the whole report at once
+    """
+    rows = iter(rows)
+    with ExitStack() as stack:
+        if pager:
+            stack.enter_context(console.pager(styles=True))
+        first = True
+        while True:
+            page = list(islice(rows, page_size))
+            if not page and not first:
+                break
+            table = new_table(first)
+            for row in page:
+                table.add_row(*row)
+            console.print(table)
+            first = False
+
+
+def _status(results: MultiResult) -> Text:
+    if results.failed:
+        return Text("failed", style="red")
+    if results.changed:
+        return Text("changed", style="orange3")
+    return Text("ok", style="green")
+
+
+def _details(results: MultiResult) -> Text:
+    for r in results:
+        if r.failed:
+            return Text(f"{r.name}: {r.exception}", style="red")
+    # tasks that only run subtasks don't return anything themselves so we
+    # show the result of the last subtask that returned something
+    for r in [results[0]] + list(reversed(results[1:])):
+        if r.result is not None and r.result != "":
+            return Text(f"{r.result}", style="green")
+    return Text("", style="green")
+
+
+def _host_table(hostname: str, host_result: MultiResult) -> Table:
+    table = Table(box=MINIMAL_DOUBLE_HEAD)
+    table.add_column(hostname, justify="right", style="cyan", no_wrap=True)
+    table.add_column("result")
+    table.add_column("changed")
+
+    for r in host_result:
+        text = Text()
+        if r.failed:
+            text.append(f"{r.exception}", style="red")
+        else:
+            text.append(f"{r.result or ''}", style="green")
+
+        changed = Text()
+        if r.changed:
+            color = "orange3"
+        else:
+            color = "green"
+        changed.append(f"{r.changed}", style=color)
 
+        table.add_row(r.name, text, changed)
+
+    return table
+
+
+def _host_rows(results: AggregatedResult, failures_only: bool) -> Iterator[Row]:
     for hostname, host_result in results.items():
-        table = Table(box=MINIMAL_DOUBLE_HEAD)
-        table.add_column(hostname, justify="right", style="cyan", no_wrap=True)
-        table.add_column("result")
-        table.add_column("changed")
-
-        for r in host_result:
-            text = Text()
-            if r.failed:
-                text.append(f"{r.exception}", style="red")
-            else:
-                text.append(f"{r.result or ''}", style="green")
+        if failures_only and not host_result.failed:
+            continue
+        data = host_result.host.data if host_result.host else {}
+        yield (
+            hostname,
+            data.get("site", ""),
+            data.get("dev_type", ""),
+            _status(host_result),
+            _details(host_result),
+        )
+
+
+def _group_rows(
+    results: AggregatedResult, group_by: Sequence[str], failures_only: bool
+) -> Iterator[Row]:
+    totals: "Counter[Tuple[str, ...]]" = Counter()
+    changed: "Counter[Tuple[str, ...]]" = Counter()
+    failed: "Counter[Tuple[str, ...]]" = Counter()
+    first_error: Dict[Tuple[str, ...], Text] = {}
+    for host_result in results.values():
+        data = host_result.host.data if host_result.host else {}
+        group = tuple(str(data.get(attr, "")) for attr in group_by)
+        totals[group] += 1
+        if host_result.changed:
+            changed[group] += 1
+        if host_result.failed:
+            failed[group] += 1
+            if group not in first_error:
+                first_error[group] = _details(host_result)
+
+    for group in sorted(totals):
+        if failures_only and not failed[group]:
+            continue
+        yield (
+            *group,
+            f"{totals[group]}",
+            Text(f"{changed[group]}", style="orange3" if changed[group] else "green"),
+            Text(f"{failed[group]}", style="red" if failed[group] else "green"),
+            first_error.get(group, Text("")),
+        )
+
+
+def rich_table(
+    results: AggregatedResult,
+    group_by: Optional[Sequence[str]] = None,
+    failures_only: bool = False,
+    page_size: int = 100,
+    pager: bool = False,
+    console: Optional[Console] = None,
+    detailed: bool = False,
+) -> None:
+    """
+    Prints a compact table with a row per host, or per group of hosts if
+    ``group_by`` is given, i.e. ``["site", "dev_type"]``. Rows are generated
+    and printed ``page_size`` at a time so the output starts right away even
+    with thousands of hosts. With ``detailed`` we print instead a table per
+    host with the result of each of its subtasks
+
+    Arguments:
+        results: result of the run
+        group_by: host data attributes to aggregate the hosts by
+        failures_only: only show failed hosts or groups with failed hosts
+        page_size: rows per table
+        pager: show the output in the pager of the system
+        console: where to print the table
+        detailed: print a table per host with all its results
+    """
+    console = console or Console()
 
-            changed = Text()
-            if r.changed:
-                color = "orange3"
+    if detailed:
+        with ExitStack() as stack:
+            if pager:
+                stack.enter_context(console.pager(styles=True))
+            for hostname, host_result in results.items():
+                if not failures_only or host_result.failed:
+                    console.print(_host_table(hostname, host_result))
+        return
+
+    rows: Iterable[Row]
+    if group_by:
+        columns = list(group_by) + ["hosts", "changed", "failed", "first error"]
+        rows = _group_rows(results, group_by, failures_only)
+    else:
+        columns = ["host", "site", "dev_type", "status", "result"]
+        rows = _host_rows(results, failures_only)
+
+    # fixed widths keep the columns aligned across pages
+    name_width = max((len(h) for h in results), default=4)
+
+    def new_table(first: bool) -> Table:
+        table = Table(
+            box=MINIMAL_DOUBLE_HEAD,
+            title=results.name if first else None,
+            show_header=first,
+            expand=True,
+        )
+        for i, column in enumerate(columns[:-1]):
+            if i == 0 and not group_by:
+                table.add_column(column, style="cyan", no_wrap=True, width=name_width)
             else:
-                color = "green"
-            changed.append(f"{r.changed}", style=color)
+                table.add_column(column, style="cyan" if i == 0 else None, width=10)
+        table.add_column(columns[-1], no_wrap=True, overflow="ellipsis", ratio=1)
+        return table
 
-            table.add_row(r.name, text, changed)
+    _print_pages(console, new_table, rows, page_size, pager)
 
-        console.print(table)
 
+def _hosts(hosts: List[Host], max_hosts: int) -> str:
+    names = ", ".join([h.name for h in hosts[:max_hosts]])
+    if len(hosts) > max_hosts:
+        names += f" (+{len(hosts) - max_hosts} more)"
+    return names
+
+
+def _dc_aware_table(title: Optional[str], show_header: bool = True) -> Table:
+    table = Table(
+        box=MINIMAL_DOUBLE_HEAD, title=title, show_header=show_header, expand=True
+    )
+    table.add_column("group", justify="right", style="blue", no_wrap=True, width=28)
+    table.add_column("failed", style="red", ratio=1)
+    table.add_column("skipped", style="sky_blue3", ratio=2)
+    table.add_column("error", ratio=1)
+    return table
 
-def rich_dc_aware_report(dc_runner: DCAwareRunner) -> Table:
-    table = Table(box=MINIMAL_DOUBLE_HEAD, title="DCAwareRunner report")
-    table.add_column("group", justify="right", style="blue", no_wrap=True)
-    table.add_column("failed", style="red")
-    table.add_column("skipped", style="sky_blue3")
-    table.add_column("error")
 
+def _dc_aware_rows(dc_runner: DCAwareRunner, max_hosts: int) -> Iterator[Row]:
     for group_name, failed, skipped, exc in dc_runner.report():
-        failed_hosts = ", ".join([h.name for h in failed])
-        skipped_hosts = ", ".join([h.name for h in skipped])
-        table.add_row(group_name, failed_hosts, skipped_hosts, f"{exc}")
+        failed_hosts = _hosts(failed, max_hosts)
+        skipped_hosts = _hosts(skipped, max_hosts)
+        yield group_name, failed_hosts, skipped_hosts, f"{exc}"
+
+
+def rich_dc_aware_report(dc_runner: DCAwareRunner, max_hosts: int = 5) -> Table:
+    """
+    Returns a table with the failed and skipped hosts of each device group,
+    only the first ``max_hosts`` hosts of each list are shown
+    """
+    table = _dc_aware_table("DCAwareRunner report")
+    for row in _dc_aware_rows(dc_runner, max_hosts):
+        table.add_row(*row)
+
+    return table
+
+
+def print_dc_aware_report(
+    dc_runner: DCAwareRunner,
+    max_hosts: int = 5,
+    page_size: int = 100,
+    pager: bool = False,
+    console: Optional[Console] = None,
+) -> None:
+    """
+    Same as rich_dc_aware_report but the rows are generated and printed
+    ``page_size`` at a time, see ``rich_table``
+    """
+
+    def new_table(first: bool) -> Table:
+        return _dc_aware_table("DCAwareRunner report" if first else None, first)
+
+    rows = _dc_aware_rows(dc_runner, max_hosts)
+    _print_pages(console or Console(), new_table, rows, page_size, pager)
+
+
+def rich_site_report(dc_runner: DCAwareRunner) -> Table:
+    table = Table(box=MINIMAL_DOUBLE_HEAD, title="sites report")
+    table.add_column("site", justify="right", style="blue", no_wrap=True)
+    table.add_column("retries")
+    table.add_column("circuit breaker")
+    table.add_column("trips")
+
+    colors = {"closed": "green", "half_open": "orange3", "open": "red"}
+    for site, retries, state, trips in dc_runner.site_report():
+        table.add_row(
+            site, f"{retries}", Text(state, style=colors.get(state, "")), f"{trips}"
+        )
+
+    return table
+
+
+def rich_wave_report(dc_runner: DCAwareRunner) -> Table:
+    table = Table(box=MINIMAL_DOUBLE_HEAD, title="waves report")
+    table.add_column("wave", justify="right", style="blue", no_wrap=True)
+    table.add_column("groups")
+    table.add_column("hosts")
+    table.add_column("completed")
+    table.add_column("failed")
+    table.add_column("state")
+
+    colors = {"done": "green", "running": "orange3", "halted": "red"}
+    for wave, groups, hosts, completed, failed, state in dc_runner.wave_report():
+        table.add_row(
+            f"{wave}",
+            f"{groups}",
+            f"{hosts}",
+            f"{completed}",
+            Text(f"{failed}", style="red" if failed else "green"),
+            Text(state, style=colors.get(state, "sky_blue3")),
+        )
 
     return table
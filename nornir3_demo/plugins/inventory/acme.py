@@ -1,7 +1,13 @@
-from typing import Dict, Optional, List
+import itertools
+import json
+import os
+import pickle
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, List
 
 from nornir.core.inventory import (
-    Inventory,
+    ConnectionOptions,
     Group,
     Groups,
     Host,
@@ -10,7 +16,79 @@ from nornir.core.inventory import (
     ParentGroups,
 )
 
-from nornir3_demo.ext.inventory import ACMEAPI
+from nornir3_demo.ext.inventory import ACMEAPI, HostRecord
+from nornir3_demo.plugins.connections.acmeos import CONNECTION_NAME
+from nornir3_demo.plugins.inventory.index import HostIndex, IndexedInventory
+
+
+def build_site_group(name: str) -> Group:
+    # we also tell the connection plugin which site its hosts belong to
+    return Group(
+        name,
+        connection_options={CONNECTION_NAME: ConnectionOptions(extras={"site": name})},
+    )
+
+
+def build_host(group: Group, hostname: str, host_data: Dict[str, str]) -> Host:
+    """
+    Note that host_data is reused as the data of the host to avoid copying it
+    """
+    platform = host_data.pop("platform")
+    host_data["site"] = group.name
+    return Host(
+        name=hostname,
+        hostname=hostname,
+        platform=platform,
+        groups=ParentGroups([group]),  # we add the DC group as a parent group
+        data=host_data,  # extra data
+    )
+
+
+# slots of a Host shared by its copies, everything but its connections. We
+# use their descriptors to read them because Host.__getattribute__ would
+# resolve the attributes through the groups of the host
+HOST_SLOTS = tuple(
+    cls.__dict__[attr]
+    for cls in Host.__mro__
+    for attr in cls.__dict__.get("__slots__", ())
+    if attr != "connections"
+)
+
+
+def copy_host(host: Host) -> Host:
+    """
+    Returns a new Host with the same data as ``host``. Hosts keep their open
+    connections so each inventory served from the cache needs its own ones,
+    the data and groups are only read so they are shared
+    """
+    # we bypass the constructor and copy the slots as they are, it's several
+    # times faster and it adds up when serving thousands of hosts
+    copy = Host.__new__(Host)
+    for slot in HOST_SLOTS:
+        slot.__set__(copy, slot.__get__(host))
+    copy.connections = {}
+    return copy
+
+
+def host_matches(host: Host, site: str, host_data: Dict[str, str]) -> bool:
+    """
+    Returns True if the host was built with the given data
+    """
+    return (
+        host.data["site"] == site
+        and host.platform == host_data["platform"]
+        and len(host.data) == len(host_data)
+        and all(host.data.get(k) == v for k, v in host_data.items() if k != "platform")
+    )
+
+
+def host_record(host: Host) -> HostRecord:
+    """
+    Returns the data the host was built with
+    """
+    host_data = {k: v for k, v in host.data.items() if k != "site"}
+    host_data["platform"] = host.platform
+    return host.data["site"], host.name, host_data
 
 
 def process_dc_data(group: Group, group_data: Dict[str, Dict[str, str]]) -> Hosts:
@@ -27,50 +105,191 @@ def process_dc_data(group: Group, group_data: Dict[str, Dict[str, str]]) -> Host
     for hostname, host_data in group_data.items():
         # for each host we create a Host object mapping it's required parameters
         # with the data we got
-        hosts[hostname] = Host(
-            name=hostname,
-            hostname=hostname,
-            platform=host_data.pop("platform"),
-            groups=ParentGroups([group]),  # we add the DC group as a parent group
-            data={"site": group.name, **host_data},  # extra data
-        )
+        hosts[hostname] = build_host(group, hostname, host_data)
     return hosts
 
 
+class InventoryCache:
+    """
+    Keeps the full inventory of the backend in memory so it can be shared by
+    all the ACMEInventory objects of the process. When the data is older than
+    the TTL it's fetched again and only the hosts that changed are rebuilt.
+
+    Optionally, the data can be saved to a snapshot on disk so a new process
+    doesn't need to query the backend if the snapshot is recent enough.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.fetched = 0.0
+        self.hosts = Hosts()
+        self.groups = Groups()
+        self.index = HostIndex()
+        # position of each host in ``hosts`` so slices keep the same order
+        self.positions: Dict[str, int] = {}
+        self.counter = itertools.count()
+
+    def refresh(
+        self, conn: ACMEAPI, ttl: float, snapshot: Optional[str] = None
+    ) -> None:
+        """
+        Makes sure the cached data is not older than ``ttl`` seconds
+        """
+        with self.lock:
+            if not self.fetched and snapshot and os.path.exists(snapshot):
+                with open(snapshot, "rb") as f:
+                    fetched, records = pickle.load(f)
+                self.update(records, fetched)
+
+            if time.time() - self.fetched > ttl:
+                self.update(conn.hosts(), time.time())
+                if snapshot:
+                    self.save(snapshot)
+
+    def update(self, records: Iterable[HostRecord], fetched: float) -> None:
+        """
+        Replaces the cached data, Host objects are only rebuilt if their data changed
+        """
+        seen_hosts = set()
+        seen_sites = set()
+        for site, hostname, host_data in records:
+            seen_hosts.add(hostname)
+            seen_sites.add(site)
+
+            host = self.hosts.get(hostname)
+            if host is not None and host_matches(host, site, host_data):
+                continue
+
+            if host is not None:
+                self.index.remove(host)
+            else:
+                self.positions[hostname] = next(self.counter)
+            if site not in self.groups:
+                self.groups[site] = build_site_group(site)
+            host = self.hosts[hostname] = build_host(
+                self.groups[site], hostname, host_data
+            )
+            self.index.add(host)
+
+        for hostname in [h for h in self.hosts if h not in seen_hosts]:
+            self.index.remove(self.hosts.pop(hostname))
+            del self.positions[hostname]
+        for site in [s for s in self.groups if s not in seen_sites]:
+            del self.groups[site]
+
+        self.fetched = fetched
+
+    def save(self, snapshot: str) -> None:
+        # we write to a temporary file first so readers never see a partial snapshot
+        tmp = f"{snapshot}.tmp"
+        records = [host_record(host) for host in self.hosts.values()]
+        with open(tmp, "wb") as f:
+            pickle.dump((self.fetched, records), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snapshot)
+
+    def slice(
+        self,
+        filter_sites: Optional[List[str]] = None,
+        filter_dev_types: Optional[List[str]] = None,
+    ) -> IndexedInventory:
+        """
+        Returns an inventory with copies of the cached hosts matching the
+        filters in the order they were fetched, see ``copy_host``
+        """
+        filters = {}
+        if filter_sites is not None:
+            filters["site"] = filter_sites
+        if filter_dev_types is not None:
+            filters["dev_type"] = filter_dev_types
+
+        with self.lock:
+            groups = Groups(
+                (name, group)
+                for name, group in self.groups.items()
+                if filter_sites is None or name in filter_sites
+            )
+            if filters:
+                selected = self.index.select(**filters)
+                names = sorted(selected, key=self.positions.__getitem__)
+            else:
+                names = list(self.hosts)
+            hosts = Hosts((name, copy_host(self.hosts[name])) for name in names)
+        return IndexedInventory(hosts=hosts, groups=groups, defaults=Defaults())
+
+
+# shared by all the ACMEInventory objects using the cache, one per topology
+CACHES: Dict[str, InventoryCache] = {}
+CACHES_LOCK = threading.Lock()
+
+
+def get_cache(topology: Dict[str, Any]) -> InventoryCache:
+    key = json.dumps(topology, sort_keys=True)
+    with CACHES_LOCK:
+        if key not in CACHES:
+            CACHES[key] = InventoryCache()
+        return CACHES[key]
+
+
 class ACMEInventory:
+    """
+    Arguments:
+        filter_sites: only load hosts in these sites
+        filter_dev_types: only load hosts of these types
+        cache_ttl: if set, serve the inventory from a process-wide cache
+            refreshed every cache_ttl seconds
+        cache_snapshot: path to a file where the cache is persisted
+        topology: arguments for ACMEAPI to simulate a different fleet
+    """
+
     def __init__(
         self,
         filter_sites: Optional[List[str]] = None,
         filter_dev_types: Optional[List[str]] = None,
+        cache_ttl: Optional[float] = None,
+        cache_snapshot: Optional[str] = None,
+        topology: Optional[Dict[str, Any]] = None,
     ) -> None:
         # we will use the constructor to create the connection object
-        self.conn = ACMEAPI()
+        self.topology = topology or {}
+        self.conn = ACMEAPI(**self.topology)
 
         # we will also save the parameters so we can use them later on
         self.filter_sites = filter_sites
         self.filter_dev_types = filter_dev_types
+        self.cache_ttl = cache_ttl
+        self.cache_snapshot = cache_snapshot
 
-    def load(self) -> Inventory:
-        # we retrieve the data from the inventory passing the options we saved
-        # in he constructor
-        data = self.conn.get(self.filter_sites, self.filter_dev_types)
+    def load(self) -> IndexedInventory:
+        if self.cache_ttl is not None:
+            # the cache holds the full inventory so filtering doesn't require
+            # querying the backend again
+            cache = get_cache(self.topology)
+            cache.refresh(self.conn, self.cache_ttl, self.cache_snapshot)
+            return cache.slice(self.filter_sites, self.filter_dev_types)
 
-        # we create placeholder for the hosts and for the groups
+        # we retrieve the hosts from the inventory one at a time passing the
+        # options we saved in he constructor, this way we never hold the full
+        # response of the backend in memory
+        records = self.conn.hosts(self.filter_sites, self.filter_dev_types)
+
+        # we create placeholder for the hosts and for the groups and we index
+        # the hosts as we go so the inventory can be sliced efficiently later on
         hosts = Hosts()
         groups = Groups()
+        index = HostIndex()
 
-        # the inventory returned the hosts by datacenter so we iterate over them
-        for dc_name, dc_data in data.items():
-            # we are going to start bt creating a group per DC
-            groups[dc_name] = Group(dc_name)
-
-            # now we process the dc data we got
-            hosts_in_dc = process_dc_data(groups[dc_name], dc_data)
+        for site, hostname, host_data in records:
+            # we create a group per DC the first time we see it
+            group = groups.get(site)
+            if group is None:
+                group = groups[site] = build_site_group(site)
 
-            # we add the hosts in the dc to the main hosts object
-            hosts.update(hosts_in_dc)
+            hosts[hostname] = build_host(group, hostname, host_data)
+            index.add(hosts[hostname])
 
         # we populate the inventory and return it
         # note our inventory doesn't support defaults so we just return
         # and empty object
-        return Inventory(hosts=hosts, groups=groups, defaults=Defaults())
+        return IndexedInventory(
+            hosts=hosts, groups=groups, defaults=Defaults(), index=index
+        )
@@ -0,0 +1,108 @@
+from collections import defaultdict
+from typing import Any, DefaultDict, Dict, Iterable, Optional, Set, Tuple, Union
+
+from nornir.core import Nornir
+from nornir.core.inventory import Defaults, Groups, Host, Hosts, Inventory
+
+
+INDEXED_ATTRIBUTES = ("site", "dev_type", "rack")
+
+FilterValue = Union[str, Iterable[str]]
+
+
+class HostIndex:
+    """
+    Secondary indexes mapping the value of some host attributes to the
+    name of the hosts with that value so we can filter hosts without
+    going through all of them
+    """
+
+    def __init__(self, attributes: Tuple[str, ...] = INDEXED_ATTRIBUTES) -> None:
+        self.indexes: Dict[str, DefaultDict[str, Set[str]]] = {
+            attr: defaultdict(set) for attr in attributes
+        }
+
+    def add(self, host: Host) -> None:
+        for attr, index in self.indexes.items():
+            index[host.data[attr]].add(host.name)
+
+    def remove(self, host: Host) -> None:
+        for attr, index in self.indexes.items():
+            names = index[host.data[attr]]
+            names.discard(host.name)
+            if not names:
+                del index[host.data[attr]]
+
+    def select(self, **filters: FilterValue) -> Set[str]:
+        """
+        Returns the names of the hosts matching all the filters. The value of each
+        filter can be a single value or a list of them, in which case a host
+        matches if its attribute is any of them. For instance::
+
+            index.select(site=["earth", "mars"], dev_type="leaf", rack="100")
+        """
+        matches = []
+        for attr, values in filters.items():
+            if attr not in self.indexes:
+                raise ValueError(f"attribute {attr} is not indexed")
+            index = self.indexes[attr]
+            if isinstance(values, str):
+                matches.append(index.get(values, set()))
+            else:
+                matches.append(set().union(*(index.get(v, set()) for v in values)))
+
+        if not matches:
+            raise ValueError("at least one filter is required")
+
+        # we start by the smallest set so the intersection is as cheap as possible
+        matches.sort(key=len)
+        return matches[0].intersection(*matches[1:])
+
+
+class IndexedInventory(Inventory):
+    """
+    Inventory that builds a HostIndex of its hosts so it can be sliced
+    by site, dev_type and rack at the cost of the size of the result.
+    If no index is given it's built the first time the inventory is sliced
+    """
+
+    __slots__ = ("_index",)
+
+    def __init__(
+        self,
+        hosts: Hosts,
+        groups: Optional[Groups] = None,
+        defaults: Optional[Defaults] = None,
+        index: Optional[HostIndex] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(hosts, groups, defaults, **kwargs)
+        self._index = index
+
+    @property
+    def index(self) -> HostIndex:
+        if self._index is None:
+            self._index = HostIndex()
+            for host in self.hosts.values():
+                self._index.add(host)
+        return self._index
+
+    def slice(self, **filters: FilterValue) -> "IndexedInventory":
+        """
+        Returns a new inventory with the hosts matching the filters, see
+        ``HostIndex.select`` for details on the filters
+        """
+        names = sorted(self.index.select(**filters))
+        hosts = Hosts((name, self.hosts[name]) for name in names)
+        return IndexedInventory(hosts=hosts, groups=self.groups, defaults=self.defaults)
+
+
+def fast_filter(nr: Nornir, **filters: FilterValue) -> Nornir:
+    """
+    Same as ``Nornir.filter`` but using the indexes of an IndexedInventory
+    """
+    if not isinstance(nr.inventory, IndexedInventory):
+        raise TypeError("fast_filter requires an IndexedInventory")
+    b = Nornir(**nr.__dict__)
+    b.inventory = nr.inventory.slice(**filters)
+    return b
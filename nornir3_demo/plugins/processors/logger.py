@@ -1,72 +1,290 @@
+import atexit
+import datetime
+import json
+import logging
+import queue
+import threading
+import time
 import uuid
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from nornir.core.inventory import Host
+from nornir.core.processor import Processors
 from nornir.core.task import AggregatedResult, MultiResult, Task
 
 
-import logging
+class RunProcessors(Processors):
+    """
+    Processors of a single run. When a run starts we swap the processors of
+    the task for one of these so the copies of the task nornir makes for each
+    host and subtask carry the id of the run they belong to
+    """
+
+    def __init__(self, processors: Processors, run_id: str) -> None:
+        super().__init__(processors)
+        self.run_id = run_id
+
+
+def get_run_id(task: Task) -> str:
+    return getattr(task.processors, "run_id", "")
+
+
+class LogWriter:
+    """
+    Writes lines to a file from a dedicated thread so the workers never wait
+    for the disk. Lines are written in batches of up to ``batch_size`` lines
+    or every ``flush_interval`` seconds, whatever happens first
+    """
+
+    def __init__(
+        self, filename: str, batch_size: int = 500, flush_interval: float = 0.5
+    ) -> None:
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.file = open(filename, "a")
+        # lines to write, an Event to be set once everything before it is
+        # written or None to stop the thread
+        self.queue: "queue.Queue[Union[str, threading.Event, None]]" = queue.Queue()
+        self.thread = threading.Thread(
+            target=self._loop, name=f"LogWriter({filename})", daemon=True
+        )
+        self.thread.start()
+
+    def write(self, line: str) -> None:
+        self.queue.put(line)
+
+    def write_now(self, line: str) -> None:
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def flush(self) -> None:
+        """
+        Blocks until all the lines queued so far are written
+        """
+        if self.thread.is_alive():
+            done = threading.Event()
+            self.queue.put(done)
+            done.wait()
+
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.file.close()
+
+    def _write_batch(self, batch: List[str]) -> None:
+        if batch:
+            with self.lock:
+                self.file.write("\n".join(batch) + "\n")
+                self.file.flush()
+
+    def _loop(self) -> None:
+        while True:
+            batch: List[str] = []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while isinstance(item, str):
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                return
+
+
+WRITERS: Dict[str, LogWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(filename: str) -> LogWriter:
+    """
+    Returns the writer of the file, all the loggers writing to the same file
+    share it, tune its settings by modifying its attributes
+    """
+    with _writers_lock:
+        writer = WRITERS.get(filename)
+        if writer is None:
+            writer = WRITERS[filename] = LogWriter(filename)
+        return writer
+
+
+@atexit.register
+def close_writers() -> None:
+    # the writer threads are daemons, we make sure nothing queued is lost
+    with _writers_lock:
+        for writer in WRITERS.values():
+            writer.close()
+        WRITERS.clear()
+
+
+def _format_time(ts: float) -> str:
+    # same format logging uses for asctime
+    t = datetime.datetime.fromtimestamp(ts)
+    return f"{t:%Y-%m-%d %H:%M:%S},{t.microsecond // 1000:03d}"
 
 
 class Logger:
-    def __init__(self, filename: str, log_level: int = logging.INFO) -> None:
-        self.logger = logging.getLogger("nornir_runner_logger")
+    """
+    Logs the progress of the runs. Each run gets its own uuid and all the logs
+    of the run carry it so they can be correlated even when several runs
+    happen at the same time.
+
+    Arguments:
+        filename: file to write the logs to
+        log_level: minimum level of the logs we write, subtasks are logged at
+            DEBUG level
+        jsonl: write one json object per line instead of plain text
+        queued: write the logs from a dedicated thread in batches instead of
+            from the workers, see ``LogWriter``
+    """
 
-        handler = logging.FileHandler(filename=filename)
-        formatter = logging.Formatter("%(levelname)s:%(asctime)s:%(message)s")
-        handler.setFormatter(formatter)
+    def __init__(
+        self,
+        filename: str,
+        log_level: int = logging.INFO,
+        jsonl: bool = False,
+        queued: bool = True,
+    ) -> None:
+        self.log_level = log_level
+        self.jsonl = jsonl
+        self.queued = queued
+        self.writer = get_writer(filename)
+        # (run_id, host, task) -> time it started. Every key is written and
+        # removed by the same worker so we don't need a lock
+        self.started: Dict[Tuple[str, str, str], float] = {}
+
+    def _start(self, task: Task, host: Optional[Host]) -> None:
+        key = (get_run_id(task), host.name if host else "", task.name)
+        self.started[key] = time.perf_counter()
 
-        self.logger.setLevel(log_level)
+    def _duration(self, task: Task, host: Optional[Host]) -> Optional[float]:
+        key = (get_run_id(task), host.name if host else "", task.name)
+        started = self.started.pop(key, None)
+        if started is None:
+            return None
+        return round(time.perf_counter() - started, 6)
 
-        self.logger.addHandler(handler)
+    def log(
+        self,
+        level: int,
+        event: str,
+        task: Task,
+        host: Optional[Host] = None,
+        **fields: Any,
+    ) -> None:
+        if level < self.log_level:
+            return
+
+        run_id = get_run_id(task)
+        if self.jsonl:
+            record = {
+                "time": time.time(),
+                "level": logging.getLevelName(level),
+                "run": run_id,
+                "event": event,
+                "task": task.name,
+            }
+            if host is not None:
+                record["host"] = host.name
+                record["site"] = host.data.get("site")
+                record["dev_type"] = host.data.get("dev_type")
+            record.update(fields)
+            line = json.dumps(record, default=str)
+        else:
+            # same lines we always wrote so existing parsers keep working
+            kind, _, state = event.partition("_")
+            words = [f"{state:<9} {kind}"]
+            if kind == "task":
+                words.append(task.name)
+            else:
+                words.append(host.name if host else "")
+                if kind == "subtask":
+                    words.append(task.name)
+            if "error" in fields:
+                words.append(f"{fields['error']}")
+            elif "result" in fields:
+                words.append(f"{fields['result']}")
+            line = ":".join(
+                [logging.getLevelName(level), _format_time(time.time()), run_id] + words
+            )
+
+        if self.queued:
+            self.writer.write(line)
+        else:
+            self.writer.write_now(line)
+
+    def flush(self) -> None:
+        self.writer.flush()
 
     def task_started(self, task: Task) -> None:
-        # we generate a unique uuid and attach it to all the logs
-        # this unique uuid will allow us to correlate logs and filter them by task execution
-        self.uuid = uuid.uuid4()
-        self.logger.info("%s:starting  task:%s", self.uuid, task.name)
+        # we generate a unique uuid and attach it to all the logs of the run,
+        # it will allow us to correlate logs and filter them by task execution.
+        # We can't store it in the processor as runs may happen concurrently
+        if not isinstance(task.processors, RunProcessors):
+            task.processors = RunProcessors(task.processors, str(uuid.uuid4()))
+        self._start(task, None)
+        self.log(logging.INFO, "task_starting", task)
 
     def task_completed(self, task: Task, result: AggregatedResult) -> None:
-        self.logger.info("%s:completed task:%s", self.uuid, task.name)
+        self.log(
+            logging.INFO,
+            "task_completed",
+            task,
+            duration=self._duration(task, None),
+            hosts=len(result),
+            failed_hosts=len(result.failed_hosts),
+        )
 
     def task_instance_started(self, task: Task, host: Host) -> None:
-        self.logger.info("%s:starting  host:%s", self.uuid, task.host.name)
+        self._start(task, host)
+        self.log(logging.INFO, "host_starting", task, host)
 
     def task_instance_completed(
         self, task: Task, host: Host, results: MultiResult
     ) -> None:
-        if results.failed:
-            self.logger.error(
-                "%s:completed host:%s:%s",
-                self.uuid,
-                task.host.name,
-                results[-1].exception,
-            )
-        else:
-            self.logger.info(
-                "%s:completed host:%s:%s", self.uuid, task.host.name, results.result
-            )
+        self._log_completed("host_completed", task, host, results, logging.INFO)
 
     def subtask_instance_started(self, task: Task, host: Host) -> None:
-        self.logger.debug(
-            "%s:starting  subtask:%s:%s", self.uuid, task.host.name, task.name
-        )
+        self._start(task, host)
+        self.log(logging.DEBUG, "subtask_starting", task, host)
 
     def subtask_instance_completed(
         self, task: Task, host: Host, result: MultiResult
     ) -> None:
-        if result.failed:
-            self.logger.error(
-                "%s:completed subtask:%s:%s:%s",
-                self.uuid,
-                task.host.name,
-                task.name,
-                result.exception,
+        self._log_completed("subtask_completed", task, host, result, logging.DEBUG)
+
+    def _log_completed(
+        self, event: str, task: Task, host: Host, results: MultiResult, level: int
+    ) -> None:
+        duration = self._duration(task, host)
+        if results.failed:
+            self.log(
+                logging.ERROR,
+                event,
+                task,
+                host,
+                duration=duration,
+                failed=True,
+                changed=results.changed,
+                error=f"{results[-1].exception}",
             )
         else:
-            self.logger.debug(
-                "%s:completed subtas:%s:%s:%s",
-                self.uuid,
-                task.host.name,
-                task.name,
-                result.result,
+            self.log(
+                level,
+                event,
+                task,
+                host,
+                duration=duration,
+                failed=False,
+                changed=results.changed,
+                result=results.result,
             )
@@ -1,50 +1,373 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
 from nornir.core.inventory import Host
 from nornir.core.task import AggregatedResult, MultiResult, Task
 
-from prometheus_client import Counter
+from nornir3_demo.plugins.connections.acmeos import POOL
+from nornir3_demo.plugins.connections.pool import ConnectionPool
+from nornir3_demo.plugins.runners.breaker import (
+    BREAKERS,
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreakers,
+)
 
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+
+
+class ConnectionPoolCollector:
+    """
+    Exposes the counters of the connection pool when prometheus is scraped
+    """
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        self.pool = pool
+
+    def collect(self) -> Iterator[CounterMetricFamily]:
+        yield CounterMetricFamily(
+            "connection_pool_hits",
+            "Connections reused from the pool",
+            value=self.pool.hits,
+        )
+        yield CounterMetricFamily(
+            "connection_pool_misses",
+            "Connections that had to be established",
+            value=self.pool.misses,
+        )
+        yield CounterMetricFamily(
+            "connection_pool_evictions",
+            "Connections closed by the pool",
+            value=self.pool.evictions,
+        )
+
+
+class CircuitBreakerCollector:
+    """
+    Exposes the state of the circuit breakers of each site when prometheus
+    is scraped, the state gauge is 1 for the current state and 0 for the rest
+    """
+
+    def __init__(self, breakers: CircuitBreakers) -> None:
+        self.breakers = breakers
+
+    def collect(self) -> Iterator[Union[CounterMetricFamily, GaugeMetricFamily]]:
+        state = GaugeMetricFamily(
+            "circuit_breaker_state",
+            "State of the circuit breaker of the site",
+            labels=["site", "state"],
+        )
+        trips = CounterMetricFamily(
+            "circuit_breaker_trips",
+            "Number of times the circuit breaker of the site opened",
+            labels=["site"],
+        )
+        for site, current, num_trips in self.breakers.states():
+            for s in (CLOSED, OPEN, HALF_OPEN):
+                state.add_metric([site, s], 1 if s == current else 0)
+            trips.add_metric([site], num_trips)
+        yield state
+        yield trips
+
+
+class RunnerCollector:
+    """
+    Exposes how many device groups of the runs in progress are in each state,
+    see ``DCAwareRunner.group_stats``
+    """
 
-class Prometheus:
     def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # id of the task of the run -> runner
+        self.runners: Dict[int, Any] = {}
+
+    def add(self, task: Task) -> None:
+        # other runners don't have device groups
+        if hasattr(task.nornir.runner, "group_stats"):
+            with self.lock:
+                self.runners[id(task)] = task.nornir.runner
+
+    def remove(self, task: Task) -> None:
+        with self.lock:
+            self.runners.pop(id(task), None)
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        groups = GaugeMetricFamily(
+            "device_groups",
+            "Device groups of the runs in progress in each state",
+            labels=["state"],
+        )
+        totals: Dict[str, int] = {}
+        with self.lock:
+            runners = list(self.runners.values())
+        for runner in runners:
+            for state, value in runner.group_stats().items():
+                totals[state] = totals.get(state, 0) + value
+        for state, value in sorted(totals.items()):
+            groups.add_metric([state], value)
+        yield groups
+
+
+class HostStats:
+    """
+    Exposes per host series without letting their number grow with the size
+    of the fleet, series are rebuilt on every scrape so hosts that don't
+    qualify anymore just disappear:
+
+        recent_host_failures: failures of the hosts that failed within the
+            last ``window`` seconds, up to ``max_hosts`` of them
+        most_failing_hosts: the ``top_k`` hosts with more recent failures
+        slowest_hosts_seconds: the ``top_k`` slowest hosts within the last
+            ``window`` seconds and how long they took
+
+    Arguments:
+        window: seconds a failure or a duration is taken into account
+        top_k: number of hosts we report as slowest and most failing
+        max_hosts: maximum number of hosts with recent failures we remember,
+            the ones that failed longest ago are forgotten first
+    """
+
+    def __init__(
+        self, window: float = 900, top_k: int = 10, max_hosts: int = 100
+    ) -> None:
+        self.window = window
+        self.top_k = top_k
+        self.max_hosts = max_hosts
+        self.lock = threading.Lock()
+        # host -> [site, dev_type, failures, time of the last failure]
+        self.failures: "OrderedDict[str, List[Any]]" = OrderedDict()
+        # host -> (duration, task, site, dev_type, time it was seen)
+        self.slowest: Dict[str, Tuple[float, str, str, str, float]] = {}
+
+    def failed(self, host: Host, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            entry = self.failures.pop(host.name, None)
+            if entry is None or now - entry[3] > self.window:
+                entry = [host.data["site"], host.data["dev_type"], 0, now]
+            entry[2] += 1
+            entry[3] = now
+            self.failures[host.name] = entry
+            while len(self.failures) > self.max_hosts:
+                self.failures.popitem(last=False)
+
+    def completed(
+        self, task: Task, host: Host, duration: float, now: Optional[float] = None
+    ) -> None:
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            current = self.slowest.get(host.name)
+            if current is None and len(self.slowest) >= self.top_k:
+                fastest = min(self.slowest, key=lambda h: self.slowest[h][0])
+                if self.slowest[fastest][0] >= duration:
+                    return
+                del self.slowest[fastest]
+            elif current is not None and current[0] > duration:
+                return
+            self.slowest[host.name] = (
+                duration,
+                task.name,
+                host.data["site"],
+                host.data["dev_type"],
+                now,
+            )
+
+    def expire(self, now: float) -> None:
+        # failures are ordered by time so we can stop at the first recent one
+        while self.failures:
+            host, entry = next(iter(self.failures.items()))
+            if now - entry[3] <= self.window:
+                break
+            del self.failures[host]
+        for host in [h for h, e in self.slowest.items() if now - e[4] > self.window]:
+            del self.slowest[host]
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        recent = GaugeMetricFamily(
+            "recent_host_failures",
+            "Failures of the hosts that failed recently",
+            labels=["host", "site", "dev_type"],
+        )
+        most_failing = GaugeMetricFamily(
+            "most_failing_hosts",
+            "Failures of the hosts that failed the most recently",
+            labels=["host", "site", "dev_type"],
+        )
+        slowest = GaugeMetricFamily(
+            "slowest_hosts_seconds",
+            "Time the slowest hosts took to run a task recently",
+            labels=["host", "site", "dev_type", "task"],
+        )
+        with self.lock:
+            self.expire(time.monotonic())
+            failures = list(self.failures.items())
+            durations = list(self.slowest.items())
+
+        for host, (site, dev_type, count, _) in failures:
+            recent.add_metric([host, site, dev_type], count)
+        failures.sort(key=lambda f: f[1][2], reverse=True)
+        for host, (site, dev_type, count, _) in failures[: self.top_k]:
+            most_failing.add_metric([host, site, dev_type], count)
+        for host, (duration, task, site, dev_type, _) in durations:
+            slowest.add_metric([host, site, dev_type, task], duration)
+
+        yield recent
+        yield most_failing
+        yield slowest
+
+
+# upgrades take from a few seconds to several minutes
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, float("inf"))
+
+
+class Prometheus:
+    """
+    Processor exposing metrics about the runs
+
+    Per host series would grow with the fleet so by default hosts are
+    aggregated by site and dev_type and only a bounded number of hosts get
+    their own series, see ``HostStats``
+
+    Arguments:
+        pool: connection pool to report about
+        breakers: circuit breakers to report about
+        per_host: also count the requests and failures of every host
+        host_stats: settings for ``HostStats``
+    """
+
+    def __init__(
+        self,
+        pool: ConnectionPool = POOL,
+        breakers: CircuitBreakers = BREAKERS,
+        per_host: bool = False,
+        host_stats: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.per_host = per_host
         self.total_task_requests = Counter(
             "total_task_requests", "Total number of task requests"
         )
         self.failed_tasks = Counter("failed_tasks", "Total number of task requests")
-        self.total_tasks_per_host = Counter(
-            "total_task_requests_per_host",
-            "Total number of task requests per host",
-            ["host", "site", "dev_type"],
+        self.total_tasks_per_site = Counter(
+            "total_task_requests_per_site",
+            "Total number of task requests per site and dev_type",
+            ["site", "dev_type"],
+        )
+        self.failed_tasks_per_site = Counter(
+            "failed_tasks_per_site",
+            "Total number of failed task requests per site and dev_type",
+            ["site", "dev_type"],
+        )
+        if per_host:
+            self.total_tasks_per_host = Counter(
+                "total_task_requests_per_host",
+                "Total number of task requests per host",
+                ["host", "site", "dev_type"],
+            )
+            self.failed_tasks_per_host = Counter(
+                "failed_tasks_per_host",
+                "Total number of task requests per host",
+                ["host", "site", "dev_type"],
+            )
+        self.task_retries = Counter(
+            "task_retries",
+            "Number of times a task was retried after a transient error",
+            ["task", "site"],
         )
-        self.failed_tasks_per_host = Counter(
-            "failed_tasks_per_host",
-            "Total number of task requests per host",
-            ["host", "site", "dev_type"],
+        self.task_duration = Histogram(
+            "task_duration_seconds",
+            "Time it took to run the task on all the hosts",
+            ["task"],
+            buckets=DURATION_BUCKETS,
         )
+        self.host_duration = Histogram(
+            "host_task_duration_seconds",
+            "Time it took to run the task on a host",
+            ["task", "site", "dev_type"],
+            buckets=DURATION_BUCKETS,
+        )
+        self.subtask_duration = Histogram(
+            "subtask_duration_seconds",
+            "Time it took to run the subtask on a host",
+            ["task", "site", "dev_type"],
+            buckets=DURATION_BUCKETS,
+        )
+        self.hosts_in_flight = Gauge(
+            "hosts_in_flight", "Hosts running a task right now", ["task", "site"]
+        )
+        # (id of the processors, host, task name) -> time it started. The
+        # sharded runner replays the start and the end of a subtask with
+        # different task objects so we can't rely on the identity of the task
+        self.started: Dict[Tuple[int, str, str], float] = {}
+        self.runners = RunnerCollector()
+        self.hosts = HostStats(**(host_stats or {}))
+        REGISTRY.register(ConnectionPoolCollector(pool))
+        REGISTRY.register(CircuitBreakerCollector(breakers))
+        REGISTRY.register(self.runners)
+        REGISTRY.register(self.hosts)
+
+    def _start(self, task: Task, host: Host) -> None:
+        self.started[(id(task.processors), host.name, task.name)] = time.monotonic()
+
+    def _observe(self, histogram: Histogram, task: Task, host: Host) -> Optional[float]:
+        started = self.started.pop((id(task.processors), host.name, task.name), None)
+        if started is None:
+            return None
+        duration = time.monotonic() - started
+        labels = histogram.labels(task.name, host.data["site"], host.data["dev_type"])
+        labels.observe(duration)
+        return duration
+
+    def count_retries(self, task: Task, host: Host, results: MultiResult) -> None:
+        # the retry decorator stores the attempts in the result
+        retries = getattr(results[0], "attempts", 1) - 1 if results else 0
+        if retries:
+            self.task_retries.labels(task.name, host.data["site"]).inc(retries)
 
     def task_started(self, task: Task) -> None:
         self.total_task_requests.inc()
+        self.started[(id(task), "", task.name)] = time.monotonic()
+        self.runners.add(task)
 
     def task_completed(self, task: Task, result: AggregatedResult) -> None:
         if result.failed:
             self.failed_tasks.inc()
+        self.runners.remove(task)
+        started = self.started.pop((id(task), "", task.name), None)
+        if started is not None:
+            self.task_duration.labels(task.name).observe(time.monotonic() - started)
 
     def task_instance_started(self, task: Task, host: Host) -> None:
-        self.total_tasks_per_host.labels(
-            task.host.name, task.host.data["site"], task.host.data["dev_type"]
-        ).inc()
+        site, dev_type = host.data["site"], host.data["dev_type"]
+        self.total_tasks_per_site.labels(site, dev_type).inc()
+        if self.per_host:
+            self.total_tasks_per_host.labels(host.name, site, dev_type).inc()
+        self.hosts_in_flight.labels(task.name, host.data["site"]).inc()
+        self._start(task, host)
 
     def task_instance_completed(
         self, task: Task, host: Host, results: MultiResult
     ) -> None:
+        self.count_retries(task, host, results)
+        self.hosts_in_flight.labels(task.name, host.data["site"]).dec()
+        duration = self._observe(self.host_duration, task, host)
+        if duration is not None:
+            self.hosts.completed(task, host, duration)
         if results.failed:
-            self.failed_tasks_per_host.labels(
-                task.host.name, task.host.data["site"], task.host.data["dev_type"]
-            ).inc()
+            site, dev_type = host.data["site"], host.data["dev_type"]
+            self.failed_tasks_per_site.labels(site, dev_type).inc()
+            self.hosts.failed(host)
+            if self.per_host:
+                self.failed_tasks_per_host.labels(host.name, site, dev_type).inc()
 
     def subtask_instance_started(self, task: Task, host: Host) -> None:
-        pass
+        self._start(task, host)
 
     def subtask_instance_completed(
         self, task: Task, host: Host, result: MultiResult
     ) -> None:
-        pass
+        self.count_retries(task, host, result)
+        self._observe(self.subtask_duration, task, host)
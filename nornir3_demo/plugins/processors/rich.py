@@ -1,17 +1,51 @@
+import threading
+from collections import Counter, deque
+from typing import Deque, Dict, Optional, Tuple
+
 from nornir.core.inventory import Host
 from nornir.core.task import AggregatedResult, MultiResult, Task
 
-from rich.progress import Progress, BarColumn
+from rich.console import Console
+from rich.progress import Progress, BarColumn, TaskID
+
+
+# (site, failed, changed)
+Outcome = Tuple[str, bool, bool]
 
 
 class ProgressBar:
-    def __init__(self, total: int) -> None:
+    """
+    Shows the progress of the run
+
+    Updating rich takes a lock and may redraw the bars so, by default, the
+    workers only queue the outcome of each host and a refresher thread applies
+    them to the bars ``refresh_per_second`` times per second. Set it to None to
+    update the bars from the workers as soon as each host finishes.
+
+    Arguments:
+        total: number of hosts
+        refresh_per_second: how often the refresher thread updates the bars
+        per_site: also show a bar per site
+        console: where to draw the bars
+    """
+
+    def __init__(
+        self,
+        total: int,
+        refresh_per_second: Optional[float] = 10,
+        per_site: bool = False,
+        console: Optional[Console] = None,
+    ) -> None:
         # we will need to inform this processor the total amount of hosts
         # we instantiate a progress bar object
+        self.refresh_per_second = refresh_per_second
         self.progress = Progress(
             "[progress.description]{task.description}",
             BarColumn(),
             "[progress.percentage]{task.completed:>3.0f}/{task.total}",
+            console=console,
+            # if we are refreshing the bars ourselves rich doesn't need to
+            auto_refresh=refresh_per_second is None,
         )
 
         # we create four progress bars to track total execution, successes, errors and changes
@@ -20,20 +54,99 @@ class ProgressBar:
         self.changed = self.progress.add_task("[orange3]Changed...", total=total)
         self.error = self.progress.add_task("[red]Failed...", total=total)
 
+        self.per_site = per_site
+        self.sites: Dict[str, TaskID] = {}
+        self.site_errors: "Counter[str]" = Counter()
+        # protects site_errors when the workers update the bars themselves
+        self.lock = threading.Lock()
+
+        # appending to a deque is thread-safe and doesn't need a lock
+        self.outcomes: Deque[Outcome] = deque()
+        self.stopped = threading.Event()
+        self.refresher: Optional[threading.Thread] = None
+
     def task_started(self, task: Task) -> None:
+        if self.per_site:
+            totals = Counter(
+                h.data["site"] for h in task.nornir.inventory.hosts.values()
+            )
+            for site, total in sorted(totals.items()):
+                if site not in self.sites:
+                    self.sites[site] = self.progress.add_task(
+                        f"[blue]  {site}...", total=total
+                    )
+
         # we start the progress bar
         self.progress.start()
 
+        if self.refresh_per_second is not None:
+            self.stopped.clear()
+            self.refresher = threading.Thread(
+                target=self._refresh_loop, name="ProgressBar", daemon=True
+            )
+            self.refresher.start()
+
     def task_completed(self, task: Task, result: AggregatedResult) -> None:
+        if self.refresher is not None:
+            self.stopped.set()
+            self.refresher.join()
+            self.refresher = None
         # we stop the progress bar
         self.progress.stop()
 
+    def _refresh_loop(self) -> None:
+        interval = 1 / (self.refresh_per_second or 10)
+        while not self.stopped.wait(interval):
+            self._apply()
+        # whatever finished since the last frame
+        self._apply()
+
+    def _apply(self) -> None:
+        """
+        Pushes the outcomes queued since the last call to the bars and redraws them
+        """
+        total = successful = changed = error = 0
+        sites: "Counter[str]" = Counter()
+        while self.outcomes:
+            site, failed, has_changed = self.outcomes.popleft()
+            total += 1
+            if failed:
+                error += 1
+                self.site_errors[site] += 1
+            else:
+                successful += 1
+            if has_changed:
+                changed += 1
+            sites[site] += 1
+
+        if total:
+            self.progress.update(self.total, advance=total)
+            self.progress.update(self.successful, advance=successful)
+            self.progress.update(self.changed, advance=changed)
+            self.progress.update(self.error, advance=error)
+            for site, advance in sites.items():
+                self._update_site(site, advance)
+        self.progress.refresh()
+
+    def _update_site(self, site: str, advance: int) -> None:
+        if site not in self.sites:
+            return
+        description = f"[blue]  {site}..."
+        if self.site_errors[site]:
+            description += f" [red]{self.site_errors[site]} failed"
+        self.progress.update(self.sites[site], advance=advance, description=description)
+
     def task_instance_started(self, task: Task, host: Host) -> None:
         pass
 
     def task_instance_completed(
         self, task: Task, host: Host, results: MultiResult
     ) -> None:
+        if self.refresh_per_second is not None:
+            # the refresher thread will take it from here
+            self.outcomes.append((host.data["site"], results.failed, results.changed))
+            return
+
         # we upgrade total execution advancing 1
         self.progress.update(self.total, advance=1)
         if results.failed:
@@ -47,6 +160,12 @@ class ProgressBar:
             # if the task changed the device we increase the progress bar counting changes
             self.progress.update(self.changed, advance=1)
 
+        if self.per_site:
+            with self.lock:
+                if results.failed:
+                    self.site_errors[host.data["site"]] += 1
+                self._update_site(host.data["site"], 1)
+
     def subtask_instance_started(self, task: Task, host: Host) -> None:
         pass
 
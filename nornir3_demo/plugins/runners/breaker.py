@@ -0,0 +1,167 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, Iterator, Optional, Tuple
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# how often we check a breaker that is waiting for somebody else's probe
+POLL_INTERVAL = 1.0
+
+
+class CircuitBreaker:
+    """
+    Keeps track of the last results of a site. When too many of them failed
+    the breaker opens and no more hosts of the site are started until
+    ``cooldown`` seconds have passed. Then it lets a single host through,
+    if it succeeds the breaker closes again, otherwise it opens again. If the
+    probe doesn't report back within ``cooldown`` seconds we let another one
+    through.
+
+    Arguments:
+        settings: the CircuitBreakers the breaker belongs to, we read the
+            settings from it every time so changing them affects all its
+            breakers
+    """
+
+    def __init__(self, settings: "CircuitBreakers") -> None:
+        self.settings = settings
+        self.results: Deque[bool] = deque(maxlen=settings.window)
+        self.state = CLOSED
+        self.opened = 0.0
+        self.trips = 0
+        self.probe: Optional[str] = None
+        self.probe_started = 0.0
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self.opened = now
+        self.trips += 1
+        self.results.clear()
+
+    def allow(self, now: float) -> bool:
+        """
+        Returns True if a host of the site can start
+        """
+        if self.state == CLOSED:
+            return True
+        cooldown = self.settings.cooldown
+        if self.state == OPEN:
+            return now - self.opened >= cooldown
+        return self.probe is None or now - self.probe_started >= cooldown
+
+    def started(self, host: str, now: float) -> None:
+        if self.state == OPEN and now - self.opened >= self.settings.cooldown:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            self.probe = host
+            self.probe_started = now
+
+    def record(self, host: str, ok: bool, now: float) -> None:
+        if self.state == CLOSED:
+            if self.results.maxlen != self.settings.window:
+                self.results = deque(self.results, maxlen=self.settings.window)
+            self.results.append(ok)
+            failures = self.results.count(False)
+            if (
+                len(self.results) >= self.settings.min_requests
+                and failures / len(self.results) >= self.settings.threshold
+            ):
+                self._open(now)
+        elif self.state == HALF_OPEN and host == self.probe:
+            self.probe = None
+            if ok:
+                self.state = CLOSED
+            else:
+                self._open(now)
+        # results of hosts that started before the breaker opened are ignored
+
+    def wait_time(self, now: float) -> float:
+        """
+        Seconds until we should check again if a host of the site can start
+        """
+        if self.state == OPEN:
+            return max(0.0, self.settings.cooldown - (now - self.opened))
+        if self.state == HALF_OPEN and not self.allow(now):
+            # the probe might belong to another runner so we can't
+            # rely on it finishing to wake us up
+            return POLL_INTERVAL
+        return 0.0
+
+
+class CircuitBreakers:
+    """
+    One CircuitBreaker per site, see CircuitBreaker for details
+
+    Arguments:
+        window: number of results per site we take into account
+        threshold: ratio of failures in the window that opens the breaker
+        min_requests: minimum number of results before the breaker can open
+        cooldown: seconds we wait before letting a host through again
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        threshold: float = 0.5,
+        min_requests: int = 5,
+        cooldown: float = 30.0,
+    ) -> None:
+        self.window = window
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        # runners in different threads may share the breakers
+        self.lock = threading.Lock()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def _get(self, site: str) -> CircuitBreaker:
+        breaker = self.breakers.get(site)
+        if breaker is None:
+            breaker = self.breakers[site] = CircuitBreaker(self)
+        return breaker
+
+    def allow(self, site: str, now: float) -> bool:
+        with self.lock:
+            return self._get(site).allow(now)
+
+    def started(self, site: str, host: str, now: float) -> None:
+        with self.lock:
+            self._get(site).started(host, now)
+
+    def record(self, site: str, host: str, ok: bool, now: float) -> bool:
+        """
+        Records the result of a host, returns True if the site accepts hosts now
+        """
+        with self.lock:
+            breaker = self._get(site)
+            breaker.record(host, ok, now)
+            return breaker.allow(now)
+
+    def wait_time(self, site: str, now: float) -> float:
+        with self.lock:
+            return self._get(site).wait_time(now)
+
+    def after_fork(self) -> None:
+        """
+        Forgets the breakers of the parent process and replaces the lock,
+        which could be held by threads that don't exist in a forked process
+        """
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    def states(self) -> Iterator[Tuple[str, str, int]]:
+        """
+        Returns the site, state and number of trips of each breaker
+        """
+        with self.lock:
+            states = [(site, b.state, b.trips) for site, b in self.breakers.items()]
+        return iter(states)
+
+
+# shared by all the runners in the process so the health of a site carries
+# over runs, tune its settings by modifying its attributes, changes apply to
+# the breakers of the sites we already saw too
+BREAKERS = CircuitBreakers()
@@ -0,0 +1,113 @@
+import heapq
+import itertools
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+from nornir.core.inventory import Host
+
+
+class LatencyHistory:
+    """
+    Keeps a moving average of how long a host of each dev_type takes to run
+    the task so the scheduler can estimate how much work a device group has
+    left
+
+    Arguments:
+        alpha: weight of the last duration in the moving average
+        default: seconds we assume a host takes until we see one of its dev_type
+    """
+
+    def __init__(self, alpha: float = 0.2, default: float = 1.0) -> None:
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha has to be in the range (0, 1]")
+        self.alpha = alpha
+        self.default = default
+        # runners in different threads may share the history
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, float] = {}
+
+    def record(self, host: Host, duration: float) -> None:
+        dev_type = host.data["dev_type"]
+        with self.lock:
+            latency = self.latencies.get(dev_type)
+            if latency is None:
+                self.latencies[dev_type] = duration
+            else:
+                self.latencies[dev_type] = latency + self.alpha * (duration - latency)
+
+    def latency(self, host: Host) -> float:
+        with self.lock:
+            latency: float = self.latencies.get(host.data["dev_type"], self.default)
+        return latency
+
+    def after_fork(self) -> None:
+        """
+        Replaces the lock, which could be held by threads that don't exist in
+        a forked process. What we learned in the parent is kept
+        """
+        self.lock = threading.Lock()
+        self.latencies = dict(self.latencies)
+
+    def remaining_work(self, dg: Any) -> float:
+        """
+        Seconds the device group needs to run its pending hosts, hosts that
+        can run at the same time count once
+        """
+        if not dg.pending_hosts:
+            return 0.0
+        serial: int = math.ceil(len(dg.pending_hosts) / dg.parallelism)
+        return serial * self.latency(dg.pending_hosts[0])
+
+
+# shared by all the runners in the process so what we learn in a run carries
+# over the next ones, tune its settings by modifying its attributes
+HISTORY = LatencyHistory()
+
+
+class CriticalPathQueue:
+    """
+    Queue of device groups that hands out first the group with the most
+    remaining work so long chains of hosts start early instead of dominating
+    the time the run takes. Groups with the same amount of work keep their
+    order. It only makes a difference when there are more groups ready than
+    workers to run them.
+
+    It has the methods of a deque used by ``Root`` so it can replace it. The
+    work of a group is computed when it's queued, groups are queued again
+    after each of their hosts starts so it doesn't get too stale. Groups are
+    queued before their hosts are added to them so we compute the work of
+    all of them again the first time a group is taken from the queue
+    """
+
+    def __init__(self, history: LatencyHistory) -> None:
+        self.history = history
+        self.heap: List[Tuple[float, int, Any]] = []
+        self.counter = itertools.count()
+        self.stale = True
+
+    def append(self, dg: Any) -> None:
+        work = self.history.remaining_work(dg)
+        heapq.heappush(self.heap, (-work, next(self.counter), dg))
+
+    def extend(self, groups: Iterable[Any]) -> None:
+        for dg in groups:
+            self.append(dg)
+
+    def refresh(self) -> None:
+        """
+        Computes again the work of every queued group
+        """
+        self.heap = [
+            (-self.history.remaining_work(dg), i, dg) for _, i, dg in self.heap
+        ]
+        heapq.heapify(self.heap)
+        self.stale = False
+
+    def popleft(self) -> Any:
+        if self.stale:
+            self.refresh()
+        return heapq.heappop(self.heap)[2]
+
+    def __len__(self) -> int:
+        return len(self.heap)
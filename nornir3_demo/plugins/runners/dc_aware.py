@@ -1,39 +1,83 @@
 import time
-from typing import Dict, Iterator, List, Optional, Tuple
-from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, deque
+from itertools import islice
+from operator import itemgetter
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 
 from rich.table import Table
 from rich.box import MINIMAL_DOUBLE_HEAD
 
-from nornir.core.task import AggregatedResult, Task
+from nornir.core.task import AggregatedResult, MultiResult, Task
 from nornir.core.inventory import Host
 
+from nornir3_demo.plugins.runners.breaker import BREAKERS, CircuitBreakers
+from nornir3_demo.plugins.runners.critical_path import (
+    HISTORY,
+    CriticalPathQueue,
+    LatencyHistory,
+)
+from nornir3_demo.plugins.runners.journal import (
+    COMPLETED,
+    FAILED,
+    STARTED,
+    Journal,
+    resumed_result,
+)
+from nornir3_demo.plugins.runners.limits import (
+    ConcurrencyLimits,
+    LimitKey,
+    Limits,
+    RateLimits,
+)
+from nornir3_demo.plugins.runners.results import (
+    ResultStore,
+    check_retention,
+    compact_result,
+)
+from nornir3_demo.plugins.runners.waves import Waves, WaveReport
+
 
 class DeviceGroups:
     """
     We use device groups to group devices by their "redundancy domain"
 
     Only one host failure per device group is tolerated so if a device
-    fails we will skip pending devices
+    fails we will skip pending devices. By default hosts in a group run one
+    at a time but groups can allow ``parallelism`` hosts at the same time
     """
 
-    def __init__(self, name: str) -> None:
+    def __init__(self, name: str, parallelism: int = 1) -> None:
         self.name = name
-        self.pending_hosts: List[Host] = []
+        self.parallelism = parallelism
+        self.pending_hosts: Deque[Host] = deque()
         self.completed_hosts: List[Host] = []
         self.failed_hosts: List[Host] = []
-        self.in_progress: Optional[Host] = None
+        self.in_progress: List[Host] = []
         self.error: Optional[Exception] = None
 
     def append(self, host: Host) -> None:
         self.pending_hosts.append(host)
 
     def next(self) -> Host:
-        self.in_progress = self.pending_hosts.pop(0)
-        return self.in_progress
+        host = self.pending_hosts.popleft()
+        self.in_progress.append(host)
+        return host
 
     def ready(self) -> bool:
-        return self.in_progress is None
+        return len(self.in_progress) < self.parallelism
 
     def pending(self) -> bool:
         """
@@ -41,65 +85,329 @@ class DeviceGroups:
         """
         return len(self.pending_hosts) > 0 and len(self.failed_hosts) == 0
 
-    def complete(self) -> None:
+    def complete(self, host: Host) -> None:
         """
         when completing a host we move the host from in_progress to completed_hosts
         """
-        self.completed_hosts.append(self.in_progress)
-        self.in_progress = None
+        self.in_progress.remove(host)
+        self.completed_hosts.append(host)
+
+    def restore(self, host: Host, event: str, error: Optional[str]) -> None:
+        """
+        puts a pending host where a previous run left it, see ``Journal``.
+        Hosts that were in progress go first so they are verified before
+        running anything else in the group
+        """
+        self.pending_hosts.remove(host)
+        if event == COMPLETED:
+            self.completed_hosts.append(host)
+        elif event == FAILED:
+            self.failed_hosts.append(host)
+            self.error = Exception(error)
+        else:
+            self.pending_hosts.appendleft(host)
 
-    def fail(self, exc: Exception) -> None:
+    def fail(self, host: Host, exc: Exception) -> None:
         """
         when a host fails we move it from in_progress to failed_hosts
         this will cause pending to return false
         we also save the exception we got
         """
-        self.failed_hosts.append(self.in_progress)
+        self.in_progress.remove(host)
+        self.failed_hosts.append(host)
         self.error = exc
-        self.in_progress = None
+
+
+# by default leaves are grouped by rack and the rest of devices by type
+DEFAULT_GROUP_BY = {"*": ["site", "dev_type"], "leaf": ["site", "dev_type", "rack"]}
+
+GroupBy = Dict[str, Sequence[str]]
+Parallelism = Dict[str, int]
+
+
+class GroupKey:
+    """
+    Computes the device group of a host and how many of its hosts can run at
+    the same time. Both settings are dictionaries keyed by dev_type where
+    ``*`` applies to any dev_type not listed. For instance::
+
+        GroupKey(
+            group_by={"*": ["site", "dev_type"], "leaf": ["site", "rack"]},
+            parallelism={"leaf": 2},
+        )
+
+    would group leaves per rack and run both leaves of the rack at the same
+    time while the rest of the devices would be grouped by type and run one
+    at a time.
+
+    Arguments:
+        group_by: host data attributes that build the name of the group
+        parallelism: number of hosts of the group that can run at the same time
+    """
+
+    def __init__(
+        self,
+        group_by: Optional[GroupBy] = None,
+        parallelism: Optional[Parallelism] = None,
+    ) -> None:
+        self.group_by = group_by or DEFAULT_GROUP_BY
+        # we compile the expressions once instead of interpreting them per host
+        self.getters = {
+            dev_type: self._compile(attrs) for dev_type, attrs in self.group_by.items()
+        }
+        self.parallelism = parallelism or {}
+        for dev_type, value in self.parallelism.items():
+            if value < 1:
+                raise ValueError(f"parallelism for {dev_type} has to be >= 1")
+
+    @staticmethod
+    def _compile(attrs: Sequence[str]) -> Callable[[Dict[str, Any]], str]:
+        if not attrs:
+            raise ValueError("group_by requires at least one attribute")
+        if len(attrs) == 1:
+            attr = attrs[0]
+            return lambda data: str(data[attr])
+        getter = itemgetter(*attrs)
+        return lambda data: "_".join(map(str, getter(data)))
+
+    def name(self, host: Host) -> str:
+        dev_type = host.data["dev_type"]
+        getter = self.getters.get(dev_type) or self.getters.get("*")
+        if getter is None:
+            raise ValueError(f"don't know how to group hosts of type {dev_type}")
+        return getter(host.data)
+
+    def parallelism_for(self, host: Host) -> int:
+        dev_type = host.data["dev_type"]
+        return self.parallelism.get(dev_type, self.parallelism.get("*", 1))
+
+
+DEFAULT_GROUP_KEY = GroupKey()
 
 
 def get_group_name(host: Host) -> str:
-    site = host.data["site"]
-    dev_type = host.data["dev_type"]
-    rack = host.data["rack"]
+    return DEFAULT_GROUP_KEY.name(host)
+
 
-    if dev_type == "leaf":
-        group_name = f"{site}_{dev_type}_{rack}"
-    else:
-        group_name = f"{site}_{dev_type}"
-    return group_name
+ReadyGroups = Union[Deque[DeviceGroups], CriticalPathQueue]
 
 
 class Root(Dict[str, DeviceGroups]):
     """
     This object will serve as root for all the device groups independently
     from the DC they belong to
+
+    To avoid going through all the device groups on every scheduling decision
+    we keep track of:
+
+        ready: queue of device groups that can run their next host right now,
+            a group is queued at most once no matter its parallelism. If a
+            latency history is given groups with more work left go first,
+            see ``CriticalPathQueue``, otherwise they go in order
+        num_pending: number of device groups that still have hosts to run
+        host_groups: device group each host belongs to
+
+    If limits are given, groups whose next host doesn't fit in the budget are
+    parked under the limit that stopped them until it has budget again:
+
+        blocked: groups waiting for a host using a concurrency budget to finish
+        throttled: groups waiting for a token bucket to refill
+
+    Similarly, if circuit breakers are given, groups of a site whose breaker
+    is open are parked until it lets hosts through again:
+
+        tripped: groups waiting for the breaker of their site
+
+    And if the hosts are rolled out in waves, groups of waves that haven't
+    started are parked until their wave starts:
+
+        held: groups waiting for their wave
     """
 
+    def __init__(
+        self,
+        limits: Optional[Limits] = None,
+        breakers: Optional[CircuitBreakers] = None,
+        waves: Optional[Waves] = None,
+        history: Optional[LatencyHistory] = None,
+    ) -> None:
+        super().__init__()
+        self.ready: ReadyGroups = deque()
+        if history is not None:
+            self.ready = CriticalPathQueue(history)
+        self.num_pending = 0
+        self.host_groups: Dict[str, DeviceGroups] = {}
+        self.sites: Set[str] = set()
+        self.limits = limits or None
+        self.blocked: Dict[LimitKey, Deque[DeviceGroups]] = {}
+        self.throttled: Dict[LimitKey, Deque[DeviceGroups]] = {}
+        self.breakers = breakers
+        self.tripped: Dict[str, Deque[DeviceGroups]] = {}
+        self.waves = waves
+        self.held: Deque[DeviceGroups] = deque()
+        # time each host in progress started
+        self.started: Dict[str, float] = {}
+
+    def add(self, group_name: str, host: Host, parallelism: int = 1) -> None:
+        """
+        Adds the host to the given device group, creating it if needed
+        """
+        dg = self.get(group_name)
+        if dg is None:
+            dg = self[group_name] = DeviceGroups(group_name, parallelism)
+            self.ready.append(dg)
+            self.num_pending += 1
+        dg.append(host)
+        self.host_groups[host.name] = dg
+        self.sites.add(host.data["site"])
+
     def pending(self) -> bool:
         """
         We will return true of any device group has pending hosts
         """
-        return any([dg.pending() for dg in self.values()])
+        return self.num_pending > 0
 
     def batch(self) -> Iterator[Host]:
         """
-        Everytime this method is called we will go through all the device groups,
-        check if they are ready (no other host is running) and if they have
-        pending devices, in which, case we will yield it
+        Everytime this method is called we will yield the next host of
+        every device group that is ready (no other host is running and
+        it has pending devices) and fits in the limits
         """
-        for group_name, dg in self.items():
-            if dg.ready() and dg.pending():
-                yield dg.next()
+        now = time.monotonic()
+        if self.limits is not None:
+            refilled = [k for k in self.throttled if self.limits.wait_time(k, now) == 0]
+            for key in refilled:
+                self.ready.extend(self.throttled.pop(key))
+        if self.breakers is not None:
+            for site in [s for s in self.tripped if self.breakers.allow(s, now)]:
+                self.ready.extend(self.tripped.pop(site))
+        if self.waves is not None and not self.waves.waves:
+            # we plan the waves on the first batch so groups restored from a
+            # journal are planned with the hosts they have left
+            self.waves.plan([dg for dg in self.values() if dg.pending()])
+
+        while self.ready:
+            dg = self.ready.popleft()
+            if not dg.pending():
+                # another host of the group failed while it was waiting
+                continue
+            if self.waves is not None and not self.waves.admits(dg.name):
+                self.held.append(dg)
+                continue
+            site = dg.pending_hosts[0].data["site"]
+            if self.breakers is not None and not self.breakers.allow(site, now):
+                self.tripped.setdefault(site, deque()).append(dg)
+                continue
+            if self.limits is not None:
+                stopped = self.limits.acquire(dg.pending_hosts[0], dg.name, now)
+                if stopped is not None:
+                    kind, key = stopped
+                    parked = self.blocked if kind == "concurrency" else self.throttled
+                    parked.setdefault(key, deque()).append(dg)
+                    continue
+            host = dg.next()
+            if self.breakers is not None:
+                self.breakers.started(site, host.name, now)
+            self.started[host.name] = now
+            if not dg.pending_hosts:
+                self.num_pending -= 1
+            elif dg.ready():
+                # the group can run more hosts at the same time
+                self.ready.append(dg)
+            yield host
+
+    def next_token(self) -> Optional[float]:
+        """
+        Seconds until a throttled or tripped group may be able to run, None if
+        there are no such groups
+        """
+        now = time.monotonic()
+        waits: List[float] = []
+        if self.limits is not None:
+            waits.extend(self.limits.wait_time(key, now) for key in self.throttled)
+        if self.breakers is not None:
+            waits.extend(self.breakers.wait_time(site, now) for site in self.tripped)
+        return min(waits) if waits else None
+
+    def release(self, host: Host, dg: DeviceGroups) -> None:
+        if self.limits is None:
+            return
+        for key in self.limits.release(host, dg.name):
+            if key in self.blocked:
+                self.ready.extend(self.blocked.pop(key))
+
+    def record(self, host: Host, ok: bool) -> None:
+        if self.breakers is None:
+            return
+        site = host.data["site"]
+        accepting = self.breakers.record(site, host.name, ok, time.monotonic())
+        if accepting and site in self.tripped:
+            self.ready.extend(self.tripped.pop(site))
+
+    def record_wave(self, dg: DeviceGroups, ok: bool) -> None:
+        if self.waves is None:
+            return
+        group_done = not dg.in_progress and not dg.pending()
+        if self.waves.record(dg.name, ok, group_done):
+            # the next wave starts
+            self.ready.extend(self.held)
+            self.held.clear()
+
+    def restore(self, host: Host, event: str, error: Optional[str]) -> None:
+        """
+        Restores the state of a host from the journal of a previous run
+        """
+        dg = self.host_groups[host.name]
+        was_pending = dg.pending()
+        dg.restore(host, event, error)
+        if was_pending and not dg.pending():
+            self.num_pending -= 1
+
+    def duration(self, host: Host) -> float:
+        """
+        Seconds since the host started, it has to be called before completing
+        or failing the host
+        """
+        return time.monotonic() - self.started.get(host.name, time.monotonic())
 
     def complete(self, host: Host) -> None:
-        group_name = get_group_name(host)
-        self[group_name].complete()
+        self.started.pop(host.name, None)
+        dg = self.host_groups[host.name]
+        self.release(host, dg)
+        self.record(host, True)
+        # if the group had room it's already waiting for its turn
+        was_full = not dg.ready()
+        dg.complete(host)
+        if was_full and dg.pending():
+            self.ready.append(dg)
+        self.record_wave(dg, True)
 
     def fail(self, host: Host, exc: Exception) -> None:
-        group_name = get_group_name(host)
-        self[group_name].fail(exc)
+        self.started.pop(host.name, None)
+        dg = self.host_groups[host.name]
+        self.release(host, dg)
+        self.record(host, False)
+        if dg.pending():
+            # the group had hosts left but they are going to be skipped
+            self.num_pending -= 1
+        dg.fail(host, exc)
+        self.record_wave(dg, False)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Number of device groups in each state, the same group can be running
+        hosts and waiting for its turn to run more at the same time
+        """
+        groups = list(self.values())
+        return {
+            "pending": self.num_pending,
+            "running": sum(1 for dg in groups if dg.in_progress),
+            "ready": len(self.ready),
+            "blocked": sum(len(q) for q in list(self.blocked.values())),
+            "throttled": sum(len(q) for q in list(self.throttled.values())),
+            "tripped": sum(len(q) for q in list(self.tripped.values())),
+            "held": len(self.held),
+        }
 
     def report(self,) -> Iterator[Tuple[str, List[Host], List[Host], Exception]]:
         """
@@ -108,24 +416,30 @@ class Root(Dict[str, DeviceGroups]):
         """
         for group_name, dg in self.items():
             if dg.failed_hosts or dg.pending_hosts:
-                yield dg.name, dg.failed_hosts, dg.pending_hosts, dg.error or Exception(
-                    "unknown"
-                )
-
-
-def sort_hosts(hosts: List[Host]) -> Root:
+                skipped = list(dg.pending_hosts)
+                # groups that didn't fail were skipped because the rollout halted
+                halted = self.waves.halted if self.waves is not None else None
+                error = dg.error or halted or Exception("unknown")
+                yield dg.name, dg.failed_hosts, skipped, error
+
+
+def sort_hosts(
+    hosts: List[Host],
+    limits: Optional[Limits] = None,
+    group_key: Optional[GroupKey] = None,
+    breakers: Optional[CircuitBreakers] = None,
+    waves: Optional[Waves] = None,
+    history: Optional[LatencyHistory] = None,
+) -> Root:
     """
     This method helps sorting hosts for a given DC, it will create the corresponding
-    device groups and assign the hosts to them
+    device groups and assign the hosts to them. The group of each host is computed
+    only once here and remembered by the root object
     """
-    root = Root()
+    group_key = group_key or DEFAULT_GROUP_KEY
+    root = Root(limits, breakers, waves, history)
     for host in hosts:
-        group_name = get_group_name(host)
-
-        if group_name not in root:
-            root[group_name] = DeviceGroups(group_name)
-
-        root[group_name].append(host)
+        root.add(group_key.name(host), host, group_key.parallelism_for(host))
 
     return root
 
@@ -136,11 +450,139 @@ class DCAwareRunner:
 
     Arguments:
         num_workers: number of threads to use
+        concurrency_limits: maximum number of hosts running at the same time
+            globally, per site, dev_type or device group, see ``Limits``
+        rate_limits: token buckets limiting how often hosts are started
+            globally, per site, dev_type or device group, see ``Limits``
+        group_by: host attributes defining the device group of each dev_type,
+            see ``GroupKey``
+        group_parallelism: hosts of the same device group that can run at the
+            same time for each dev_type, see ``GroupKey``
+        circuit_breaker: if True, stop starting hosts of sites with too many
+            failures using the breakers shared by the process. It can also be
+            a dict with the arguments for a ``CircuitBreakers`` object used
+            only by this runner
+        retention: what we keep of the result of each host, "full", "compact"
+            or "spill", see ``results.RETENTIONS``
+        spill_path: sqlite database where the full results are written when
+            retention is "spill", they can be read back with ``self.store``
+        journal_path: file where we journal the hosts we start, complete and
+            fail so the run can be resumed if the process dies, see ``Journal``
+        resume: resume the run journaled in ``journal_path`` instead of
+            starting from scratch. Completed hosts are not run again, groups
+            with failed hosts stay blocked and hosts that were in progress run
+            again first so the task can verify their state
+        waves: if given, roll out the task in waves of device groups starting
+            with a canary and halting if a wave fails too much, it's a dict
+            with the arguments for a ``Waves`` object
+        critical_path: if True, when there are more groups ready than workers
+            start first the groups with more work left, estimated with the
+            latencies of previous hosts kept in the history shared by the
+            process. It can also be a dict with the arguments for a
+            ``LatencyHistory`` object used only by this runner
     """
 
-    def __init__(self, num_workers: int = 20) -> None:
+    def __init__(
+        self,
+        num_workers: int = 20,
+        concurrency_limits: Optional[ConcurrencyLimits] = None,
+        rate_limits: Optional[RateLimits] = None,
+        group_by: Optional[GroupBy] = None,
+        group_parallelism: Optional[Parallelism] = None,
+        circuit_breaker: Union[bool, Dict[str, Any]] = False,
+        retention: str = "full",
+        spill_path: Optional[str] = None,
+        journal_path: Optional[str] = None,
+        resume: bool = False,
+        waves: Optional[Dict[str, Any]] = None,
+        critical_path: Union[bool, Dict[str, float]] = False,
+    ) -> None:
+        check_retention(retention, spill_path)
         self.num_workers = num_workers
-        self.oor = Root()
+        self.concurrency_limits = concurrency_limits
+        self.rate_limits = rate_limits
+        self.group_key = GroupKey(group_by, group_parallelism)
+        self.breakers: Optional[CircuitBreakers] = None
+        if isinstance(circuit_breaker, dict):
+            self.breakers = CircuitBreakers(**circuit_breaker)
+        elif circuit_breaker:
+            self.breakers = BREAKERS
+        self.root = Root()
+        self.retries: "Counter[str]" = Counter()
+        self.retention = retention
+        self.store: Optional[ResultStore] = None
+        if retention == "spill" and spill_path:
+            self.store = ResultStore(spill_path)
+        self.journal = Journal(journal_path) if journal_path else None
+        self.resume = resume
+        self.waves = waves
+        self.wave_plan: Optional[Waves] = None
+        self.history: Optional[LatencyHistory] = None
+        if isinstance(critical_path, dict):
+            self.history = LatencyHistory(**critical_path)
+        elif critical_path:
+            self.history = HISTORY
+
+    def limits(self) -> Limits:
+        """
+        Budgets are consumed while running so we need fresh ones on every run
+        """
+        return Limits(self.concurrency_limits, self.rate_limits)
+
+    def reset(self, hosts: List[Host]) -> None:
+        """
+        Prepares the state for a new run, we create the root object with all
+        the device groups in it
+        """
+        # the plan is built for the hosts of each run
+        self.wave_plan = Waves(**self.waves) if self.waves is not None else None
+        self.root = sort_hosts(
+            hosts,
+            self.limits(),
+            self.group_key,
+            self.breakers,
+            self.wave_plan,
+            self.history,
+        )
+        self.retries = Counter()
+        if self.store is not None:
+            self.store.clear()
+
+    def start(self, task: Task, hosts: List[Host]) -> AggregatedResult:
+        """
+        Prepares the state for a new run and returns the object where we will
+        store its results. When resuming, the hosts that finished before are
+        restored from the journal and their results are added right away
+        """
+        self.reset(hosts)
+        result = AggregatedResult(task.name)
+        if self.journal is None:
+            return result
+
+        if self.resume:
+            state = self.journal.read(task.name)
+            for host in hosts:
+                if host.name not in state:
+                    continue
+                event, error = state[host.name]
+                self.root.restore(host, event, error)
+                if event != STARTED:
+                    result[host.name] = resumed_result(task.name, host, event, error)
+        self.journal.open(task.name, self.resume)
+        return result
+
+    def finish(self) -> None:
+        if self.journal is not None:
+            self.journal.close()
+
+    def batch(self) -> Iterator[Host]:
+        """
+        Same as ``Root.batch`` but journaling the hosts we start
+        """
+        for host in self.root.batch():
+            if self.journal is not None:
+                self.journal.started(host.name)
+            yield host
 
     def report(self) -> Iterator[Tuple[str, List[Host], List[Host], Exception]]:
         """
@@ -148,39 +590,105 @@ class DCAwareRunner:
         """
         return self.root.report()
 
+    def wave_report(self) -> Iterator[WaveReport]:
+        """
+        Returns the wave, number of groups, hosts, completed and failed hosts
+        and state of each wave of the last run, nothing if it wasn't rolled out
+        in waves
+        """
+        if self.wave_plan is not None:
+            yield from self.wave_plan.report()
+
+    def group_stats(self) -> Dict[str, int]:
+        """
+        Number of device groups in each state for the current run, it's safe to
+        call it from another thread while the run is in progress
+        """
+        return self.root.stats()
+
+    def site_report(self) -> Iterator[Tuple[str, int, str, int]]:
+        """
+        Returns the site, number of retries, state of the circuit breaker and
+        number of times it tripped for each site of the last run
+        """
+        states = {}
+        if self.breakers is not None:
+            states = {site: (state, n) for site, state, n in self.breakers.states()}
+        for site in sorted(self.root.sites):
+            state, trips = states.get(site, ("disabled", 0))
+            yield site, self.retries[site], state, trips
+
+    def process_result(
+        self, result: AggregatedResult, worker_result: MultiResult
+    ) -> None:
+        """
+        Stores the result of a host and updates the state of its device group
+        """
+        host = worker_result.host
+        # the retry decorator tells us how many attempts each subtask needed
+        self.retries[host.data["site"]] += sum(
+            getattr(r, "attempts", 1) - 1 for r in worker_result
+        )
+        duration = self.root.duration(host)
+        if self.history is not None:
+            self.history.record(host, duration)
+        if self.retention != "full":
+            if self.store is not None:
+                self.store.add(worker_result)
+            worker_result = compact_result(worker_result, duration)
+        result[host.name] = worker_result
+
+        if worker_result.failed:
+            exc = worker_result[-1].exception
+            self.root.fail(host, exc)
+            if self.journal is not None:
+                self.journal.failed(host.name, f"{exc}")
+        else:
+            self.root.complete(host)
+            if self.journal is not None:
+                self.journal.completed(host.name)
+
     def run(self, task: Task, hosts: List[Host]) -> AggregatedResult:
         """
         This is where the magic happens
         """
 
         # first we create the root object with all the device groups in it
-        self.root = sort_hosts(hosts)
-
-        # we instantiate the aggregated result
-        result = AggregatedResult(task.name)
+        # and we instantiate the aggregated result
+        result = self.start(task, hosts)
 
         # when sending the tasks to the pool we will store the futures here
-        futures = []
+        futures: Set["Future[MultiResult]"] = set()
 
         with ThreadPoolExecutor(self.num_workers) as pool:
-            while self.root.pending():
-                # for as long as we have pending objects
-
-                # we execute the task over a batch of devices and store
-                # the futures
-                for host in self.root.batch():
+            while True:
+                # we send to the pool every host that is ready to run, after the
+                # first pass this is only the next host of the groups that just
+                # finished so each group moves at its own pace. We only take
+                # hosts from the scheduler while there are free workers so
+                # decisions like opening a circuit breaker apply to hosts that
+                # didn't start and hosts don't wait in the queue of the pool
+                for host in islice(self.batch(), self.num_workers - len(futures)):
                     future = pool.submit(task.copy().start, host)
-                    futures.append(future)
-
-                # we process the futures
-                while futures:
-                    future = futures.pop(0)
-                    worker_result = future.result()
-                    result[worker_result.host.name] = worker_result
-                    if worker_result.failed:
-                        self.root.fail(worker_result.host, worker_result[-1].exception)
-                    else:
-                        self.root.complete(worker_result.host)
-                time.sleep(1)
+                    futures.add(future)
+
+                # if some groups are waiting for their rate limit we need to wake
+                # up in time to schedule them even if nothing finishes
+                timeout = self.root.next_token()
+
+                # if nothing is running and nothing could be scheduled we are done
+                if not futures:
+                    if timeout is None:
+                        break
+                    time.sleep(timeout)
+                    continue
+
+                # we wait until at least one host finishes and process it right away
+                done, futures = wait(
+                    futures, timeout=timeout, return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    self.process_result(result, future.result())
 
+        self.finish()
         return result
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import traceback
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Set, Union, cast
+
+from nornir.core.exceptions import NornirSubTaskError
+from nornir.core.task import AggregatedResult, MultiResult, Result, Task
+from nornir.core.inventory import Host
+
+from nornir3_demo.plugins.connections.acmeos_async import close_connection
+from nornir3_demo.plugins.runners.dc_aware import (
+    DCAwareRunner,
+    GroupBy,
+    Parallelism,
+)
+from nornir3_demo.plugins.runners.limits import ConcurrencyLimits, RateLimits
+
+
+logger = logging.getLogger(__name__)
+
+
+async def start_task(task: Task, host: Host) -> MultiResult:
+    """
+    Coroutine equivalent to ``Task.start``, the function wrapped by the task
+    has to be a coroutine function
+    """
+    task.host = host
+
+    if task.parent_task is not None:
+        task.processors.subtask_instance_started(task, host)
+    else:
+        task.processors.task_instance_started(task, host)
+    try:
+        r = await task.task(task, **task.params)
+        if not isinstance(r, Result):
+            r = Result(host=host, result=r)
+
+    except NornirSubTaskError as e:
+        tb = traceback.format_exc()
+        logger.error(
+            "Host %r: task %r failed with traceback:\n%s", host.name, task.name, tb
+        )
+        r = Result(host, exception=e, result=str(e), failed=True)
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        logger.error(
+            "Host %r: task %r failed with traceback:\n%s", host.name, task.name, tb
+        )
+        r = Result(host, exception=e, result=tb, failed=True)
+
+    r.name = task.name
+    r.severity_level = logging.ERROR if r.failed else task.severity_level
+
+    task.results.insert(0, r)
+
+    if task.parent_task is not None:
+        task.processors.subtask_instance_completed(task, host, task.results)
+    else:
+        task.processors.task_instance_completed(task, host, task.results)
+    return task.results
+
+
+async def run_task(
+    parent: Task, task: Callable[..., Any], **kwargs: Any
+) -> MultiResult:
+    """
+    Coroutine equivalent to ``Task.run``, use it to run subtasks from
+    inside an async task
+    """
+    if "severity_level" not in kwargs:
+        kwargs["severity_level"] = parent.severity_level
+
+    subtask = Task(
+        task,
+        parent.nornir,
+        global_dry_run=parent.global_dry_run,
+        processors=parent.processors,
+        parent_task=parent,
+        **kwargs,
+    )
+    r = await start_task(subtask, parent.host)
+    parent.results.append(r[0] if len(r) == 1 else cast(Result, r))
+
+    if r.failed:
+        raise NornirSubTaskError(task=subtask, result=r)
+
+    return r
+
+
+class AsyncDCAwareRunner(DCAwareRunner):
+    """
+    AsyncDCAwareRunner follows the same rules as DCAwareRunner but runs
+    async tasks in an asyncio event loop instead of using threads
+
+    Arguments:
+        num_workers: maximum number of hosts running at the same time
+        concurrency_limits: same as in DCAwareRunner
+        rate_limits: same as in DCAwareRunner
+        group_by: same as in DCAwareRunner
+        group_parallelism: same as in DCAwareRunner
+        circuit_breaker: same as in DCAwareRunner
+        retention: same as in DCAwareRunner
+        spill_path: same as in DCAwareRunner
+        journal_path: same as in DCAwareRunner
+        resume: same as in DCAwareRunner
+        waves: same as in DCAwareRunner
+        critical_path: same as in DCAwareRunner
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 1000,
+        concurrency_limits: Optional[ConcurrencyLimits] = None,
+        rate_limits: Optional[RateLimits] = None,
+        group_by: Optional[GroupBy] = None,
+        group_parallelism: Optional[Parallelism] = None,
+        circuit_breaker: Union[bool, Dict[str, Any]] = False,
+        retention: str = "full",
+        spill_path: Optional[str] = None,
+        journal_path: Optional[str] = None,
+        resume: bool = False,
+        waves: Optional[Dict[str, Any]] = None,
+        critical_path: Union[bool, Dict[str, float]] = False,
+    ) -> None:
+        super().__init__(
+            num_workers,
+            concurrency_limits,
+            rate_limits,
+            group_by,
+            group_parallelism,
+            circuit_breaker,
+            retention,
+            spill_path,
+            journal_path,
+            resume,
+            waves,
+            critical_path,
+        )
+
+    def run(self, task: Task, hosts: List[Host]) -> AggregatedResult:
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._run(task, hosts))
+        finally:
+            loop.close()
+
+    async def _run(self, task: Task, hosts: List[Host]) -> AggregatedResult:
+        result = self.start(task, hosts)
+
+        # the semaphore plays the role of the thread pool size
+        semaphore = asyncio.Semaphore(self.num_workers)
+
+        async def worker(host: Host) -> MultiResult:
+            async with semaphore:
+                return await start_task(task.copy(), host)
+
+        futures: Set["asyncio.Future[MultiResult]"] = set()
+        while True:
+            for host in islice(self.batch(), self.num_workers - len(futures)):
+                futures.add(asyncio.ensure_future(worker(host)))
+
+            timeout = self.root.next_token()
+            if not futures:
+                if timeout is None:
+                    break
+                await asyncio.sleep(timeout)
+                continue
+
+            done, futures = await asyncio.wait(
+                futures, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                self.process_result(result, future.result())
+
+        # connections are bound to this event loop so we close them before leaving
+        await asyncio.gather(
+            *[close_connection(host) for host in hosts], return_exceptions=True
+        )
+        self.finish()
+        return result
@@ -0,0 +1,472 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from nornir.core.inventory import Host
+from nornir.core.processor import Processors
+from nornir.core.task import AggregatedResult, MultiResult, Result, Task
+
+from nornir3_demo.plugins.connections.acmeos import POOL
+from nornir3_demo.plugins.runners.breaker import BREAKERS
+from nornir3_demo.plugins.runners.critical_path import HISTORY
+from nornir3_demo.plugins.runners.dc_aware import DCAwareRunner, GroupBy, Parallelism
+from nornir3_demo.plugins.runners.limits import ConcurrencyLimits, RateLimits
+from nornir3_demo.plugins.runners.results import (
+    PackedResult,
+    ResultStore,
+    check_retention,
+    compact_result,
+    pack_result,
+    picklable,
+    unpack_result,
+)
+from nornir3_demo.plugins.tasks.facts_cache import FACTS
+
+
+# events sent by the workers: (event, hostname, task name, packed result)
+Event = Tuple[str, str, str, Optional[PackedResult]]
+# workers send the events in batches to reduce the overhead of the queue
+Batch = List[Event]
+# same as DCAwareRunner.report() but with hostnames instead of Host objects
+PackedReport = List[Tuple[str, List[str], List[str], Exception]]
+# same as DCAwareRunner.site_report()
+SiteReport = List[Tuple[str, int, str, int]]
+ShardReport = Tuple[PackedReport, SiteReport]
+# process running a shard and the end of the pipe where it sends its report
+Worker = Tuple[
+    multiprocessing.process.BaseProcess, multiprocessing.connection.Connection
+]
+
+# the workers are forked, this is how they get the task, the shards
+# and the queue without having to pickle them
+_task: Optional[Task] = None
+_shards: List[List[Host]] = []
+_events: Optional["multiprocessing.Queue[Batch]"] = None
+
+
+class ForwardingProcessor:
+    """
+    Processor used inside the workers to send the events to the parent
+    process so it can call the real processors. Events are buffered and
+    sent in batches by a background thread every ``interval`` seconds
+    """
+
+    def __init__(
+        self, events: "multiprocessing.Queue[Batch]", interval: float = 0.05
+    ) -> None:
+        self.events = events
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.buffer: Batch = []
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+        if batch:
+            self.events.put(batch)
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.flusher.join()
+        self.flush()
+
+    def _send(self, event: Event) -> None:
+        with self.lock:
+            self.buffer.append(event)
+
+    def task_started(self, task: Task) -> None:
+        pass
+
+    def task_completed(self, task: Task, result: AggregatedResult) -> None:
+        pass
+
+    def task_instance_started(self, task: Task, host: Host) -> None:
+        self._send(("started", host.name, task.name, None))
+
+    def task_instance_completed(
+        self, task: Task, host: Host, results: MultiResult
+    ) -> None:
+        self._send(("completed", host.name, task.name, pack_result(results)))
+
+    def subtask_instance_started(self, task: Task, host: Host) -> None:
+        self._send(("subtask_started", host.name, task.name, None))
+
+    def subtask_instance_completed(
+        self, task: Task, host: Host, result: MultiResult
+    ) -> None:
+        self._send(("subtask_completed", host.name, task.name, pack_result(result)))
+
+
+def _reset_globals() -> None:
+    """
+    Workers are forked while other threads of the parent (log writers,
+    progress bars, other runners...) may be holding the locks of the
+    process-wide objects, we give them new ones before using them
+    """
+    POOL.after_fork()
+    FACTS.after_fork()
+    BREAKERS.after_fork()
+    HISTORY.after_fork()
+
+
+def _run_shard(
+    index: int, options: Dict[str, Any], conn: multiprocessing.connection.Connection
+) -> None:
+    """
+    Runs inside the worker, executes the task over the hosts of the shard
+    with a regular DCAwareRunner and sends its report, or the error that
+    stopped it, through ``conn``
+    """
+    assert _task is not None and _events is not None
+    _reset_globals()
+    # forked workers inherit the state of the random generator
+    random.seed()
+
+    forwarder = ForwardingProcessor(_events)
+    task = _task.copy()
+    task.processors = Processors([forwarder])
+
+    try:
+        try:
+            runner = DCAwareRunner(**options)
+            runner.run(task, _shards[index])
+        finally:
+            # events of the same process arrive in order so this tells the
+            # parent it has received everything from this shard
+            forwarder.close()
+            _events.put([("done", str(index), "", None)])
+
+        packed_report = [
+            (name, [h.name for h in failed], [h.name for h in skipped], picklable(exc))
+            for name, failed, skipped, exc in runner.report()
+        ]
+        conn.send((packed_report, list(runner.site_report())))
+    except Exception as e:
+        conn.send(picklable(e))
+    finally:
+        conn.close()
+
+
+def shard_hosts(hosts: List[Host], num_shards: int) -> List[List[Host]]:
+    """
+    Splits the hosts by site so device groups never span more than one shard,
+    sites are assigned to the shard with fewer hosts, biggest sites first
+    """
+    sites: Dict[str, List[Host]] = {}
+    for host in hosts:
+        sites.setdefault(host.data["site"], []).append(host)
+
+    shards: List[List[Host]] = [[] for _ in range(min(num_shards, len(sites)))]
+    for site_hosts in sorted(sites.values(), key=len, reverse=True):
+        min(shards, key=len).extend(site_hosts)
+    return shards
+
+
+class ShardedDCAwareRunner:
+    """
+    ShardedDCAwareRunner splits the hosts by site and runs each shard
+    in a different process using a DCAwareRunner so CPU-bound work in tasks
+    and processors can use more than one core. Processors are called in
+    the parent process as the workers report events.
+
+    Workers are forked so this runner is only supported on platforms with
+    the fork start method. The process-wide connection pool and circuit
+    breakers start empty in each worker and connections opened by the workers
+    are not returned to the parent process. If a worker dies abruptly (e.g.
+    it runs out of memory) the hosts we know it was running fail and the rest
+    of its hosts are reported as skipped.
+
+    Limits are enforced by each process independently. As sites never span
+    more than one shard, site and device group limits behave as usual but
+    global and dev_type limits apply to each process. For the same reason
+    each process has its own circuit breakers, their state is not shared with
+    the parent or with other runs.
+
+    Arguments:
+        num_workers: number of threads to use in each process
+        num_processes: number of processes to use, defaults to the number of cpus
+        concurrency_limits: same as in DCAwareRunner, enforced per process
+        rate_limits: same as in DCAwareRunner, enforced per process
+        group_by: same as in DCAwareRunner but groups can't span more than one
+            site so they always include the site
+        group_parallelism: same as in DCAwareRunner
+        circuit_breaker: same as in DCAwareRunner
+        retention: same as in DCAwareRunner, applied by the parent process
+        spill_path: same as in DCAwareRunner
+
+    The rest of the options of DCAwareRunner (journal_path, resume, waves and
+    critical_path) are not supported.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 20,
+        num_processes: Optional[int] = None,
+        concurrency_limits: Optional[ConcurrencyLimits] = None,
+        rate_limits: Optional[RateLimits] = None,
+        group_by: Optional[GroupBy] = None,
+        group_parallelism: Optional[Parallelism] = None,
+        circuit_breaker: Union[bool, Dict[str, Any]] = False,
+        retention: str = "full",
+        spill_path: Optional[str] = None,
+    ) -> None:
+        for attrs in (group_by or {}).values():
+            if "site" not in attrs:
+                raise ValueError("group_by has to include the site to shard by site")
+        check_retention(retention, spill_path)
+        self.retention = retention
+        self.store: Optional[ResultStore] = None
+        if retention == "spill" and spill_path:
+            self.store = ResultStore(spill_path)
+        self.num_processes = num_processes or os.cpu_count() or 1
+        # options for the DCAwareRunner of each process
+        self.options = {
+            "num_workers": num_workers,
+            "concurrency_limits": concurrency_limits,
+            "rate_limits": rate_limits,
+            "group_by": group_by,
+            "group_parallelism": group_parallelism,
+            "circuit_breaker": circuit_breaker,
+            # results reach us through the events, workers don't need to keep
+            # them unless they are needed in full
+            "retention": "full" if retention == "full" else "compact",
+        }
+        self.reports: List[Tuple[str, List[Host], List[Host], Exception]] = []
+        # time each host in progress started
+        self.started: Dict[str, float] = {}
+        self.site_reports: SiteReport = []
+
+    def report(self) -> Iterator[Tuple[str, List[Host], List[Host], Exception]]:
+        """
+        Iterate over all the device groups of all the shards and return their report
+        """
+        return iter(self.reports)
+
+    def site_report(self) -> Iterator[Tuple[str, int, str, int]]:
+        """
+        Same as DCAwareRunner.site_report() for all the shards
+        """
+        return iter(sorted(self.site_reports))
+
+    def run(self, task: Task, hosts: List[Host]) -> AggregatedResult:
+        global _task, _shards, _events
+
+        result = AggregatedResult(task.name)
+        self.reports = []
+        self.site_reports = []
+        self.started = {}
+        if self.store is not None:
+            self.store.clear()
+        shards = shard_hosts(hosts, self.num_processes)
+        if not shards:
+            return result
+
+        ctx = multiprocessing.get_context("fork")
+        _task, _shards, _events = task, shards, ctx.Queue()
+        workers: List[Worker] = []
+        try:
+            for i in range(len(shards)):
+                reader, writer = ctx.Pipe(duplex=False)
+                process = ctx.Process(
+                    target=_run_shard, args=(i, self.options, writer), daemon=True
+                )
+                process.start()
+                # we close our end so reading fails if the worker dies
+                writer.close()
+                workers.append((process, reader))
+
+            dead = self._process_events(task, shards, result, _events, workers)
+            shard_reports = []
+            for i, (_, reader) in enumerate(workers):
+                if i in dead:
+                    continue
+                try:
+                    shard_report = reader.recv()
+                except EOFError:
+                    # it died after its hosts completed, we only miss its report
+                    continue
+                if isinstance(shard_report, Exception):
+                    raise shard_report
+                shard_reports.append(shard_report)
+        finally:
+            for worker, reader in workers:
+                reader.close()
+                worker.join()
+            _task, _shards, _events = None, [], None
+
+        by_name = {h.name: h for h in hosts}
+        for packed_report, site_report in shard_reports:
+            self.site_reports.extend(site_report)
+            for name, failed, skipped, exc in packed_report:
+                self.reports.append(
+                    (
+                        name,
+                        [by_name[h] for h in failed],
+                        [by_name[h] for h in skipped],
+                        exc,
+                    )
+                )
+        return result
+
+    def _process_events(
+        self,
+        task: Task,
+        shards: List[List[Host]],
+        result: AggregatedResult,
+        events: "multiprocessing.Queue[Batch]",
+        workers: List[Worker],
+    ) -> Set[int]:
+        """
+        Replays the events of the workers on the processors of the parent and
+        stores the results until all the shards are done. Returns the shards
+        whose worker died before finishing
+        """
+        by_name = {h.name: h for shard in shards for h in shard}
+        # tasks we pass to the processors, one per host
+        host_tasks: Dict[str, Task] = {}
+
+        done: Set[int] = set()
+        dead: Set[int] = set()
+        # workers we saw exiting without telling us they were done
+        exited: Set[int] = set()
+        while len(done) + len(dead) < len(workers):
+            try:
+                batch = events.get(timeout=1)
+            except queue.Empty:
+                for i, (process, _) in enumerate(workers):
+                    if i in done or i in dead or process.exitcode is None:
+                        continue
+                    if i in exited:
+                        # everything it sent before exiting would have arrived
+                        # by now, it died without finishing the shard
+                        dead.add(i)
+                        self._fail_shard(
+                            task, result, shards[i], host_tasks, process.exitcode
+                        )
+                    else:
+                        exited.add(i)
+                continue
+
+            for event, hostname, name, packed in batch:
+                if event == "done":
+                    # the hostname of this event is the index of the shard
+                    done.add(int(hostname))
+                else:
+                    self._process_event(
+                        task, result, by_name[hostname], host_tasks, event, name, packed
+                    )
+        return dead
+
+    def _fail_shard(
+        self,
+        task: Task,
+        result: AggregatedResult,
+        shard: List[Host],
+        host_tasks: Dict[str, Task],
+        exitcode: int,
+    ) -> None:
+        """
+        Fails the hosts in progress of a shard whose worker died and reports
+        the ones that didn't start as skipped, per site
+        """
+        error = Exception(
+            f"the worker running the shard died with exit code {exitcode}"
+        )
+        sites: Dict[str, Tuple[List[Host], List[Host]]] = {}
+        for host in shard:
+            if host.name in result:
+                continue
+            failed, skipped = sites.setdefault(host.data["site"], ([], []))
+            if host.name not in self.started:
+                skipped.append(host)
+                continue
+
+            failed.append(host)
+            r = Result(host, result=str(error), exception=error, failed=True)
+            r.name = task.name
+            r.severity_level = logging.ERROR
+            multi_result = MultiResult(task.name)
+            multi_result.append(r)
+            self._process_event(
+                task,
+                result,
+                host,
+                host_tasks,
+                "completed",
+                task.name,
+                pack_result(multi_result),
+            )
+
+        for site, (failed, skipped) in sites.items():
+            self.reports.append((site, failed, skipped, error))
+
+    def _process_event(
+        self,
+        task: Task,
+        result: AggregatedResult,
+        host: Host,
+        host_tasks: Dict[str, Task],
+        event: str,
+        name: str,
+        packed: Optional[PackedResult],
+    ) -> None:
+        if event in ("started", "completed"):
+            host_task = host_tasks.get(host.name)
+            if host_task is None:
+                host_task = host_tasks[host.name] = task.copy()
+                host_task.host = host
+        else:
+            host_task = Task(
+                task.task,
+                task.nornir,
+                task.global_dry_run,
+                task.processors,
+                name=name,
+                severity_level=task.severity_level,
+                parent_task=host_tasks[host.name],
+            )
+            host_task.host = host
+
+        if event == "started":
+            self.started[host.name] = time.monotonic()
+            task.processors.task_instance_started(host_task, host)
+        elif event == "subtask_started":
+            task.processors.subtask_instance_started(host_task, host)
+        elif event == "subtask_completed" and packed is not None:
+            host_task.results = unpack_result(name, host, packed)
+            task.processors.subtask_instance_completed(
+                host_task, host, host_task.results
+            )
+        elif event == "completed" and packed is not None:
+            multi_result = unpack_result(name, host, packed)
+            host_task.results = multi_result
+            task.processors.task_instance_completed(host_task, host, multi_result)
+            result[host.name] = self.retain(multi_result, host)
+            if self.retention != "full":
+                # the task references the full result
+                del host_tasks[host.name]
+
+    def retain(self, multi_result: MultiResult, host: Host) -> MultiResult:
+        """
+        Returns what we keep of the result of the host, see ``retention``
+        """
+        started = self.started.pop(host.name, None)
+        if self.retention == "full":
+            return multi_result
+        if self.store is not None:
+            self.store.add(multi_result)
+        duration = time.monotonic() - started if started is not None else 0.0
+        return compact_result(multi_result, duration)
@@ -0,0 +1,117 @@
+import json
+import os
+from typing import Any, Dict, Optional, TextIO, Tuple
+
+from nornir.core.inventory import Host
+from nornir.core.task import MultiResult, Result
+
+
+STARTED = "started"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# host -> (last event, error)
+JournalState = Dict[str, Tuple[str, Optional[str]]]
+
+
+class Journal:
+    """
+    Append-only log of the hosts the runner starts, completes and fails so a
+    run interrupted by a crash can be resumed where it left off. Each line is
+    a json object, the first one tells which task the run was for::
+
+        {"event": "run", "task": "upgrade_os"}
+        {"event": "started", "host": "leaf01.earth"}
+        {"event": "failed", "host": "leaf01.earth", "error": "..."}
+
+    Lines are flushed to the OS as they are written so they survive the
+    process dying, set ``fsync`` to True to survive the machine dying too at
+    the cost of a disk sync per line
+    """
+
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self.file: Optional[TextIO] = None
+
+    def read(self, task_name: str) -> JournalState:
+        """
+        Returns the last event of each host of the run journaled in the file,
+        raises ValueError if the run was for a different task
+        """
+        state: JournalState = {}
+        if not os.path.exists(self.path):
+            return state
+
+        with open(self.path, "r") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # we died while writing this line
+                    continue
+                if entry["event"] == "run":
+                    if entry["task"] != task_name:
+                        raise ValueError(
+                            f"{self.path} journals a run of {entry['task']}, "
+                            f"can't resume {task_name} from it"
+                        )
+                    continue
+                state[entry["host"]] = (entry["event"], entry.get("error"))
+        return state
+
+    def open(self, task_name: str, resume: bool) -> None:
+        """
+        Starts journaling a run, unless we are resuming a previous run we
+        start from scratch
+        """
+        self.close()
+        if resume and os.path.exists(self.path):
+            self.file = open(self.path, "a")
+            # a partial line would corrupt the one we are about to write
+            self.file.write("\n")
+        else:
+            self.file = open(self.path, "w")
+            self._write({"event": "run", "task": task_name})
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        assert self.file is not None
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def started(self, host: str) -> None:
+        self._write({"event": STARTED, "host": host})
+
+    def completed(self, host: str) -> None:
+        self._write({"event": COMPLETED, "host": host})
+
+    def failed(self, host: str, error: str) -> None:
+        self._write({"event": FAILED, "host": host, "error": error})
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def resumed_result(
+    name: str, host: Host, event: str, error: Optional[str]
+) -> MultiResult:
+    """
+    Result of a host that finished before the run was resumed
+    """
+    multi_result = MultiResult(name)
+    r = Result(
+        host=host,
+        result=error if event == FAILED else "completed before resuming",
+        failed=event == FAILED,
+        exception=Exception(error) if event == FAILED else None,
+        resumed=True,
+    )
+    r.name = name
+    multi_result.append(r)
+    return multi_result
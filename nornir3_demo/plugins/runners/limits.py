@@ -0,0 +1,181 @@
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from nornir.core.inventory import Host
+
+
+# limits can be set on these dimensions, "global" applies to all the hosts
+DIMENSIONS = ("global", "site", "dev_type", "group")
+
+# (dimension, value), for instance ("site", "earth") or ("global", "")
+LimitKey = Tuple[str, str]
+
+# {"rate": tokens per second, "burst": max tokens}
+RateLimit = Dict[str, float]
+
+ConcurrencyLimits = Dict[str, Union[int, Dict[str, int]]]
+RateLimits = Dict[str, Union[RateLimit, Dict[str, RateLimit]]]
+
+
+class TokenBucket:
+    """
+    Classic token bucket, tokens are added at ``rate`` per second up to ``burst``
+    and starting a host takes one token
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate has to be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now: float) -> bool:
+        self.refill(now)
+        return self.tokens >= 1
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def wait_time(self, now: float) -> float:
+        """
+        Seconds until the next token is available
+        """
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+def _per_key(dimension: str, value: Any) -> Iterator[Tuple[LimitKey, Any]]:
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"unknown dimension {dimension}, use one of {DIMENSIONS}")
+    if dimension == "global":
+        yield ("global", ""), value
+        return
+    if not isinstance(value, dict):
+        raise ValueError(f"limits for {dimension} have to be a dict")
+    for k, v in value.items():
+        yield (dimension, k), v
+
+
+class Limits:
+    """
+    Concurrency budgets and rate limits enforced by the runners when picking
+    the next host to run. Both are dictionaries where the keys are the
+    dimension and the values either the limit, for ``global``, or a
+    dictionary with the limit for each value of the dimension. The special
+    value ``*`` applies to every value not listed explicitly. For instance::
+
+        Limits(
+            concurrency={"global": 50, "site": {"*": 10, "earth": 20}},
+            rate={"dev_type": {"spine": {"rate": 0.5, "burst": 2}}},
+        )
+
+    would run at most 50 hosts at the same time, 10 per site except for earth
+    where we allow 20, and would start at most one spine every 2 seconds
+    allowing bursts of 2 spines.
+
+    Arguments:
+        concurrency: maximum number of hosts running at the same time
+        rate: token buckets limiting how often hosts can be started
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[ConcurrencyLimits] = None,
+        rate: Optional[RateLimits] = None,
+    ) -> None:
+        self.concurrency: Dict[LimitKey, int] = {}
+        for dimension, value in (concurrency or {}).items():
+            for key, limit in _per_key(dimension, value):
+                if limit < 1:
+                    raise ValueError(f"concurrency limit for {key} has to be >= 1")
+                self.concurrency[key] = limit
+
+        self.rate: Dict[LimitKey, RateLimit] = {}
+        for dimension, settings in (rate or {}).items():
+            for key, rate_limit in _per_key(dimension, settings):
+                # we build a bucket here to validate the settings
+                TokenBucket(**rate_limit)
+                self.rate[key] = rate_limit
+
+        self.dimensions = {d for d, _ in self.concurrency} | {d for d, _ in self.rate}
+        self.in_use: Dict[LimitKey, int] = {}
+        self.buckets: Dict[LimitKey, TokenBucket] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.concurrency or self.rate)
+
+    def keys(self, host: Host, group: str) -> List[LimitKey]:
+        """
+        Returns the keys the host counts against
+        """
+        values = {
+            "global": "",
+            "site": host.data["site"],
+            "dev_type": host.data["dev_type"],
+            "group": group,
+        }
+        return [(d, values[d]) for d in DIMENSIONS if d in self.dimensions]
+
+    def _has_concurrency(self, key: LimitKey) -> bool:
+        return key in self.concurrency or (key[0], "*") in self.concurrency
+
+    def _limit(self, key: LimitKey) -> int:
+        return self.concurrency.get(key, self.concurrency.get((key[0], "*"), 0))
+
+    def _bucket(self, key: LimitKey) -> Optional[TokenBucket]:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            limit = self.rate.get(key, self.rate.get((key[0], "*")))
+            if limit is None:
+                return None
+            # every value matching "*" gets its own bucket
+            bucket = self.buckets[key] = TokenBucket(**limit)
+        return bucket
+
+    def acquire(
+        self, host: Host, group: str, now: float
+    ) -> Optional[Tuple[str, LimitKey]]:
+        """
+        Tries to reserve the budget to start the host. Returns None if the host
+        can start or ("concurrency" | "rate", key) with the limit that stopped it
+        """
+        keys = self.keys(host, group)
+        for key in keys:
+            if not self._has_concurrency(key):
+                continue
+            if self.in_use.get(key, 0) >= self._limit(key):
+                return "concurrency", key
+
+        buckets = [(key, self._bucket(key)) for key in keys]
+        for key, bucket in buckets:
+            if bucket is not None and not bucket.available(now):
+                return "rate", key
+
+        # we only take the budget once we know we can take all of it
+        for key, bucket in buckets:
+            if bucket is not None:
+                bucket.take()
+            if self._has_concurrency(key):
+                self.in_use[key] = self.in_use.get(key, 0) + 1
+        return None
+
+    def release(self, host: Host, group: str) -> List[LimitKey]:
+        """
+        Returns the budget taken by the host, returns the keys that got some back
+        """
+        released = []
+        for key in self.keys(host, group):
+            if self._has_concurrency(key):
+                self.in_use[key] -= 1
+                released.append(key)
+        return released
+
+    def wait_time(self, key: LimitKey, now: float) -> float:
+        bucket = self._bucket(key)
+        return bucket.wait_time(now) if bucket is not None else 0.0
@@ -0,0 +1,177 @@
+import pickle
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from nornir.core.inventory import Host
+from nornir.core.task import MultiResult, Result
+
+
+# a packed result is a list with the attributes of each Result in the MultiResult
+PackedResult = List[Dict[str, Any]]
+
+# what the runners keep of the result of each host:
+#
+#     full: the MultiResult as returned by the task
+#     compact: a MultiResult with a single Result with the status, a short
+#         error and the duration, see ``compact_result``
+#     spill: same as compact but the full result is written to a ResultStore
+RETENTIONS = ("full", "compact", "spill")
+
+# longest error message we keep in a compact result
+MAX_ERROR_LENGTH = 200
+
+
+def check_retention(retention: str, spill_path: Optional[str]) -> None:
+    if retention not in RETENTIONS:
+        raise ValueError(f"retention has to be one of {', '.join(RETENTIONS)}")
+    if retention == "spill" and not spill_path:
+        raise ValueError("retention 'spill' requires a spill_path")
+
+
+def picklable(obj: Any) -> Any:
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    if isinstance(obj, BaseException):
+        # exceptions with attributes (i.e. NornirSubTaskError) may reference the
+        # task and through it the whole inventory, we don't want to send that
+        if not vars(obj):
+            try:
+                # some exceptions can be pickled but not unpickled
+                pickle.loads(pickle.dumps(obj))
+                return obj
+            except Exception:
+                pass
+        return Exception(f"{type(obj).__name__}: {obj}")
+    try:
+        pickle.dumps(obj)
+        return obj
+    except Exception:
+        return repr(obj)
+
+
+def pack_result(multi_result: MultiResult) -> PackedResult:
+    return [
+        {
+            "name": r.name,
+            "result": picklable(r.result),
+            "changed": r.changed,
+            "diff": r.diff,
+            "failed": r.failed,
+            "exception": picklable(r.exception) if r.exception else None,
+            "severity_level": r.severity_level,
+            "attempts": getattr(r, "attempts", None),
+        }
+        for r in multi_result
+    ]
+
+
+def unpack_result(name: str, host: Host, packed: PackedResult) -> MultiResult:
+    multi_result = MultiResult(name)
+    for data in packed:
+        r = Result(
+            host=host,
+            result=data["result"],
+            changed=data["changed"],
+            diff=data["diff"],
+            failed=data["failed"],
+            exception=data["exception"],
+            severity_level=data["severity_level"],
+        )
+        r.name = data["name"]
+        if data["attempts"] is not None:
+            r.attempts = data["attempts"]
+        multi_result.append(r)
+    return multi_result
+
+
+def compact_result(multi_result: MultiResult, duration: float) -> MultiResult:
+    """
+    Returns a MultiResult with a single Result that only knows if the host
+    failed or changed, the error if it failed and how long it took. It doesn't
+    reference the exception of the task so its traceback can be freed
+    """
+    first = multi_result[0]
+    error = None
+    # the last failed result is the subtask that caused the failure
+    for r in reversed(multi_result):
+        if r.failed:
+            error = f"{r.name}: {type(r.exception).__name__}: {r.exception}"
+            break
+
+    compact = MultiResult(multi_result.name)
+    r = Result(
+        host=first.host,
+        result=error[:MAX_ERROR_LENGTH] if error else None,
+        changed=multi_result.changed,
+        failed=multi_result.failed,
+        exception=Exception(error[:MAX_ERROR_LENGTH]) if error else None,
+        severity_level=first.severity_level,
+        duration=round(duration, 6),
+    )
+    r.name = multi_result.name
+    compact.append(r)
+    return compact
+
+
+class ResultStore:
+    """
+    Keeps the full results of a run in a sqlite database so they don't need
+    to stay in memory, they are read back one at a time when requested
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # the results can be recovered by running the task again so we
+        # prefer cheap writes over surviving a power loss
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "host TEXT PRIMARY KEY, task TEXT, failed INTEGER, result BLOB)"
+        )
+
+    def clear(self) -> None:
+        with self.lock:
+            self.db.execute("DELETE FROM results")
+
+    def add(self, multi_result: MultiResult) -> None:
+        data = pickle.dumps(pack_result(multi_result))
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (multi_result.host.name, multi_result.name, multi_result.failed, data),
+            )
+
+    def get(self, host: Host) -> Optional[MultiResult]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT task, result FROM results WHERE host = ?", (host.name,)
+            ).fetchone()
+        if row is None:
+            return None
+        return unpack_result(row[0], host, pickle.loads(row[1]))
+
+    def results(
+        self, hosts: Dict[str, Host], failed_only: bool = False
+    ) -> Iterator[Tuple[str, MultiResult]]:
+        """
+        Yields the name and the full result of each host we have a result
+        for, ``hosts`` maps the names to the hosts of the run
+        """
+        query = "SELECT host FROM results"
+        if failed_only:
+            query += " WHERE failed"
+        # we only keep the names in memory, results are read on demand
+        with self.lock:
+            names = [row[0] for row in self.db.execute(query)]
+        for name in names:
+            multi_result = self.get(hosts[name])
+            if multi_result is not None:
+                yield name, multi_result
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,142 @@
+import math
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# (wave, groups, hosts, completed, failed, state)
+WaveReport = Tuple[int, int, int, int, int, str]
+
+
+class Waves:
+    """
+    Rolls out the task in waves of device groups. The first wave is a canary
+    with a small slice of the groups spread across the sites, each wave after
+    it is ``growth`` times bigger than the previous one. A wave only starts if
+    the previous one finished with an error rate under ``max_error_rate`` and
+    no more hosts are started once ``failure_budget`` hosts have failed.
+
+    Groups that don't get to run are reported as skipped.
+
+    Arguments:
+        canary: fraction of the groups in the first wave, at least one group
+        growth: how many times bigger each wave is than the previous one
+        max_error_rate: ratio of the hosts of a wave that can fail before we
+            stop rolling out
+        failure_budget: number of hosts that can fail in the whole run before
+            we stop starting hosts, None means no limit
+        canary_dev_types: if given, groups of these dev_types go first so the
+            canary and the first waves are made of them, i.e. ``["leaf"]``
+    """
+
+    def __init__(
+        self,
+        canary: float = 0.01,
+        growth: float = 2.0,
+        max_error_rate: float = 0.1,
+        failure_budget: Optional[int] = None,
+        canary_dev_types: Optional[Sequence[str]] = None,
+    ) -> None:
+        if not 0 < canary <= 1:
+            raise ValueError("canary has to be a fraction of the groups")
+        if growth < 1:
+            raise ValueError("growth has to be >= 1")
+        self.canary = canary
+        self.growth = growth
+        self.max_error_rate = max_error_rate
+        self.failure_budget = failure_budget
+        self.canary_dev_types = canary_dev_types or []
+
+        # wave each device group belongs to
+        self.group_wave: Dict[str, int] = {}
+        # per wave: groups, hosts, groups still running, completed and failed hosts
+        self.waves: List[List[int]] = []
+        self.current = 0
+        self.failed = 0
+        self.halted: Optional[Exception] = None
+
+    def _order(self, groups: Sequence[Any]) -> List[Any]:
+        """
+        Interleaves the groups of each site so every wave touches as many
+        sites as possible, groups of ``canary_dev_types`` go first
+        """
+        ordered: List[Any] = []
+        for first in (True, False):
+            sites: "OrderedDict[str, List[Any]]" = OrderedDict()
+            for dg in groups:
+                host = dg.pending_hosts[0]
+                if (host.data["dev_type"] in self.canary_dev_types) == first:
+                    sites.setdefault(host.data["site"], []).append(dg)
+            per_site = list(sites.values())
+            for i in range(max((len(s) for s in per_site), default=0)):
+                ordered.extend(s[i] for s in per_site if i < len(s))
+        return ordered
+
+    def plan(self, groups: Sequence[Any]) -> None:
+        """
+        Assigns the device groups to the waves
+        """
+        ordered = self._order(groups)
+        size = max(1, math.ceil(len(ordered) * self.canary))
+        start = 0
+        while start < len(ordered):
+            wave = ordered[start : start + size]
+            for dg in wave:
+                self.group_wave[dg.name] = len(self.waves)
+            hosts = sum(len(dg.pending_hosts) for dg in wave)
+            self.waves.append([len(wave), hosts, len(wave), 0, 0])
+            start += size
+            size = max(size + 1, math.ceil(size * self.growth))
+
+    def admits(self, group_name: str) -> bool:
+        """
+        Returns True if hosts of the group can start
+        """
+        return self.halted is None and self.group_wave[group_name] <= self.current
+
+    def record(self, group_name: str, ok: bool, group_done: bool) -> bool:
+        """
+        Records the result of a host, ``group_done`` tells if it was the last
+        host of the group that will run. Returns True if a new wave started
+        """
+        wave = self.waves[self.group_wave[group_name]]
+        if ok:
+            wave[3] += 1
+        else:
+            wave[4] += 1
+            self.failed += 1
+            if self.failure_budget is not None and self.failed >= self.failure_budget:
+                self.halted = Exception(
+                    f"rollout aborted, {self.failed} hosts failed "
+                    f"(budget: {self.failure_budget})"
+                )
+        if group_done:
+            wave[2] -= 1
+
+        # once all the groups of the current wave are done we decide if the
+        # next one can start
+        if self.halted is not None or wave[2] or self.waves[self.current] is not wave:
+            return False
+        _, _, _, completed, failed = wave
+        error_rate = failed / (completed + failed) if completed + failed else 0.0
+        if error_rate > self.max_error_rate:
+            self.halted = Exception(
+                f"rollout halted, wave {self.current} error rate "
+                f"{error_rate:.0%} over {self.max_error_rate:.0%}"
+            )
+            return False
+        self.current += 1
+        return True
+
+    def report(self) -> Iterator[WaveReport]:
+        """
+        Returns the wave, number of groups, hosts, completed and failed hosts
+        and state of each wave
+        """
+        for i, (groups, hosts, _, completed, failed) in enumerate(self.waves):
+            if i < self.current:
+                state = "done"
+            elif i == self.current:
+                state = "halted" if self.halted is not None else "running"
+            else:
+                state = "skipped" if self.halted is not None else "pending"
+            yield i, groups, hosts, completed, failed, state
@@ -1,8 +1,18 @@
+from typing import Any, List
+
 from nornir.core.task import Result, Task
 
+from nornir3_demo.ext.acmeos import Command
+
 from nornir3_demo.plugins.connections.acmeos import CONNECTION_NAME
+from nornir3_demo.plugins.tasks.facts_cache import FACTS, cached
+from nornir3_demo.plugins.tasks.retry import retry
 
 
+# reading from the device is idempotent so we can retry transient errors and
+# serve the result from the facts cache if we read it recently
+@cached("version")
+@retry()
 def get_version(task: Task) -> Result:
     # nornir manages the connection automatically using the Connection plugin
     # To retrieve it you can just call the following method. Note that
@@ -15,18 +25,28 @@ def get_version(task: Task) -> Result:
     return Result(host=task.host, result=version_info)
 
 
+@cached("cpu_ram")
+@retry()
 def get_cpu_ram(task: Task) -> Result:
     device = task.host.get_connection(CONNECTION_NAME, task.nornir.config)
     return Result(host=task.host, result=device.get_cpu_ram())
 
 
+# we don't know how far the installation went when it fails so we can't
+# retry it blindly
 def install_os_version(task: Task, version: str) -> Result:
     device = task.host.get_connection(CONNECTION_NAME, task.nornir.config)
 
+    try:
+        result = device.install_os_version(version)
+    finally:
+        # whether it succeeds or not the version we cached can't be trusted
+        # anymore, we forget it once the installation is over so a read that
+        # happened while installing doesn't leave the old version cached
+        FACTS.invalidate(task.host.name, "version")
+
     # note that we set changed=True as we changed the system
-    return Result(
-        host=task.host, result=device.install_os_version(version), changed=True
-    )
+    return Result(host=task.host, result=result, changed=True)
 
 
 def upgrade_os(task: Task, version: str) -> Result:
@@ -40,3 +60,51 @@ def upgrade_os(task: Task, version: str) -> Result:
     # otherwise we call install_os_version task to install the image
     task.run(task=install_os_version, version=version)
     return Result(host=task.host, changed=True, result="success!!!")
+
+
+def run_commands(task: Task, commands: List[Command]) -> Result:
+    """
+    Sends all the commands to the device in a single round-trip, see
+    ``AcmeOSAPI.batch``. Don't retry it if any of the commands changes the device
+    """
+    device = task.host.get_connection(CONNECTION_NAME, task.nornir.config)
+    try:
+        return Result(host=task.host, result=device.batch(commands))
+    finally:
+        # same as in install_os_version
+        if any(name == "install_os_version" for name, _ in commands):
+            FACTS.invalidate(task.host.name, "version")
+
+
+@retry()
+def get_facts(task: Task, use_cache: bool = True) -> Result:
+    # same as calling get_version and get_cpu_ram but paying a single round-trip
+    name = task.host.name
+    version = FACTS.get(name, "version") if use_cache else None
+    cpu_ram = FACTS.get(name, "cpu_ram") if use_cache else None
+    if version is None or cpu_ram is None:
+        device = task.host.get_connection(CONNECTION_NAME, task.nornir.config)
+        version, cpu_ram = device.batch([("get_version", {}), ("get_cpu_ram", {})])
+        FACTS.set(name, "version", version)
+        FACTS.set(name, "cpu_ram", cpu_ram)
+    return Result(host=task.host, result={"version": version, "cpu_ram": cpu_ram})
+
+
+def upgrade_os_checked(task: Task, version: str, max_cpu: int = 90) -> Result:
+    """
+    Same as upgrade_os but we also make sure the device isn't too busy before
+    installing the image. The checks are pipelined so we only pay two round-trips,
+    the installation depends on the checks so it can't go in the same batch
+    """
+    # the check is only as good as the cpu usage is fresh so we don't use the
+    # cache, reading the version in the same batch costs nearly nothing
+    facts: Any = task.run(task=get_facts, use_cache=False).result
+
+    if facts["version"]["full_version"] == version:
+        return Result(host=task.host, result="nothing to do!!!")
+
+    if facts["cpu_ram"]["cpu"] > max_cpu:
+        raise Exception(f"cpu usage too high: {facts['cpu_ram']['cpu']}%")
+
+    task.run(task=install_os_version, version=version)
+    return Result(host=task.host, changed=True, result="success!!!")
@@ -0,0 +1,83 @@
+from typing import Any, List
+
+from nornir.core.task import Result, Task
+
+from nornir3_demo.ext.acmeos import Command
+
+from nornir3_demo.plugins.connections.acmeos_async import get_connection
+from nornir3_demo.plugins.runners.dc_aware_async import run_task
+from nornir3_demo.plugins.tasks.facts_cache import FACTS, async_cached
+from nornir3_demo.plugins.tasks.retry import async_retry
+
+
+# these tasks are the coroutine version of the ones in nornir3_demo.plugins.tasks.acmeos
+# and need to be executed with the AsyncDCAwareRunner
+
+
+@async_cached("version")
+@async_retry()
+async def get_version(task: Task) -> Result:
+    device = await get_connection(task.host, task.nornir.config)
+    return Result(host=task.host, result=await device.get_version())
+
+
+@async_cached("cpu_ram")
+@async_retry()
+async def get_cpu_ram(task: Task) -> Result:
+    device = await get_connection(task.host, task.nornir.config)
+    return Result(host=task.host, result=await device.get_cpu_ram())
+
+
+async def install_os_version(task: Task, version: str) -> Result:
+    device = await get_connection(task.host, task.nornir.config)
+    try:
+        result = await device.install_os_version(version)
+    finally:
+        FACTS.invalidate(task.host.name, "version")
+    return Result(host=task.host, result=result, changed=True)
+
+
+async def upgrade_os(task: Task, version: str) -> Result:
+    result = await run_task(task, get_version)
+
+    if result.result["full_version"] == version:
+        return Result(host=task.host, result="nothing to do!!!")
+
+    await run_task(task, install_os_version, version=version)
+    return Result(host=task.host, changed=True, result="success!!!")
+
+
+async def run_commands(task: Task, commands: List[Command]) -> Result:
+    device = await get_connection(task.host, task.nornir.config)
+    try:
+        return Result(host=task.host, result=await device.batch(commands))
+    finally:
+        if any(name == "install_os_version" for name, _ in commands):
+            FACTS.invalidate(task.host.name, "version")
+
+
+@async_retry()
+async def get_facts(task: Task, use_cache: bool = True) -> Result:
+    name = task.host.name
+    version = FACTS.get(name, "version") if use_cache else None
+    cpu_ram = FACTS.get(name, "cpu_ram") if use_cache else None
+    if version is None or cpu_ram is None:
+        device = await get_connection(task.host, task.nornir.config)
+        commands: List[Command] = [("get_version", {}), ("get_cpu_ram", {})]
+        version, cpu_ram = await device.batch(commands)
+        FACTS.set(name, "version", version)
+        FACTS.set(name, "cpu_ram", cpu_ram)
+    return Result(host=task.host, result={"version": version, "cpu_ram": cpu_ram})
+
+
+async def upgrade_os_checked(task: Task, version: str, max_cpu: int = 90) -> Result:
+    facts: Any = (await run_task(task, get_facts, use_cache=False)).result
+
+    if facts["version"]["full_version"] == version:
+        return Result(host=task.host, result="nothing to do!!!")
+
+    if facts["cpu_ram"]["cpu"] > max_cpu:
+        raise Exception(f"cpu usage too high: {facts['cpu_ram']['cpu']}%")
+
+    await run_task(task, install_os_version, version=version)
+    return Result(host=task.host, changed=True, result="success!!!")
@@ -0,0 +1,267 @@
+import functools
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from nornir.core.task import Result, Task
+
+
+# (host, fact)
+FactKey = Tuple[str, str]
+# (time it was stored, value)
+Entry = Tuple[float, Any]
+
+
+class MemoryBackend:
+    """
+    Keeps the facts in memory, when there are more than ``max_size`` facts
+    the least recently used ones are evicted
+    """
+
+    def __init__(self, max_size: int = 100000) -> None:
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[FactKey, Entry]" = OrderedDict()
+
+    def get(self, key: FactKey) -> Optional[Entry]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key: FactKey, entry: Entry) -> None:
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key: FactKey) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def delete_host(self, host: str) -> None:
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == host]:
+                del self.entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def after_fork(self) -> None:
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+
+class DiskBackend:
+    """
+    Keeps the facts in a sqlite database so they survive the process, values
+    are stored as json. When there are more than ``max_size`` facts the least
+    recently used ones are evicted
+    """
+
+    def __init__(self, path: str, max_size: int = 100000) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.db = self._connect()
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS facts ("
+            "host TEXT, fact TEXT, stored REAL, used REAL, value TEXT, "
+            "PRIMARY KEY (host, fact))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS facts_used ON facts (used)")
+        # we keep track of the size so we don't need to count rows on every write
+        self.size = self.db.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # a cache doesn't need to survive a power loss, we prefer cheap writes
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=OFF")
+        return db
+
+    def get(self, key: FactKey) -> Optional[Entry]:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT stored, value FROM facts WHERE host = ? AND fact = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE facts SET used = ? WHERE host = ? AND fact = ?",
+                (time.time(), *key),
+            )
+            return row[0], json.loads(row[1])
+
+    def set(self, key: FactKey, entry: Entry) -> None:
+        stored, value = entry
+        with self.lock:
+            cursor = self.db.execute(
+                "UPDATE facts SET stored = ?, used = ?, value = ? "
+                "WHERE host = ? AND fact = ?",
+                (stored, time.time(), json.dumps(value), *key),
+            )
+            if cursor.rowcount:
+                return
+            self.db.execute(
+                "INSERT INTO facts VALUES (?, ?, ?, ?, ?)",
+                (*key, stored, time.time(), json.dumps(value)),
+            )
+            self.size += 1
+            if self.size > self.max_size:
+                cursor = self.db.execute(
+                    "DELETE FROM facts WHERE rowid IN "
+                    "(SELECT rowid FROM facts ORDER BY used LIMIT ?)",
+                    (self.size - self.max_size,),
+                )
+                self.size -= cursor.rowcount
+
+    def delete(self, key: FactKey) -> None:
+        with self.lock:
+            cursor = self.db.execute(
+                "DELETE FROM facts WHERE host = ? AND fact = ?", key
+            )
+            self.size -= cursor.rowcount
+
+    def delete_host(self, host: str) -> None:
+        with self.lock:
+            cursor = self.db.execute("DELETE FROM facts WHERE host = ?", (host,))
+            self.size -= cursor.rowcount
+
+    def clear(self) -> None:
+        with self.lock:
+            self.db.execute("DELETE FROM facts")
+            self.size = 0
+
+    def after_fork(self) -> None:
+        # sqlite connections can't be used across a fork
+        self.lock = threading.Lock()
+        self.db = self._connect()
+
+
+class FactsCache:
+    """
+    Caches the facts read from the devices so repeated reads within the TTL
+    don't need to go to the network. Tasks that change the device are
+    responsible for invalidating the facts they change
+
+    Arguments:
+        backend: where the facts are stored, MemoryBackend or DiskBackend
+        ttl: seconds a fact is considered fresh, 0 disables the cache
+        ttls: per fact TTL overriding ``ttl``, i.e. ``{"cpu_ram": 30}``
+    """
+
+    def __init__(
+        self,
+        backend: Any = None,
+        ttl: float = 300,
+        ttls: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, host: str, fact: str) -> Optional[Any]:
+        """
+        Returns the value of the fact or None if it's not cached or it's stale
+        """
+        ttl = self.ttls.get(fact, self.ttl)
+        entry = self.backend.get((host, fact)) if ttl else None
+        if entry is None or time.time() - entry[0] > ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, host: str, fact: str, value: Any) -> None:
+        if self.ttls.get(fact, self.ttl):
+            self.backend.set((host, fact), (time.time(), value))
+
+    def invalidate(self, host: str, fact: Optional[str] = None) -> None:
+        """
+        Forgets the given fact of the host or all of them if no fact is given
+        """
+        if fact is None:
+            self.backend.delete_host(host)
+        else:
+            self.backend.delete((host, fact))
+
+    def clear(self) -> None:
+        """
+        Forgets all the facts
+        """
+        self.backend.clear()
+
+    def after_fork(self) -> None:
+        """
+        Prepares the backend to be used in a forked process, its locks could
+        be held by threads that don't exist there
+        """
+        self.backend.after_fork()
+
+
+# shared by all the tasks in the process, tune it by modifying its attributes,
+# for instance, to persist the facts:
+#
+#     FACTS.backend = DiskBackend("facts.db")
+FACTS = FactsCache()
+
+
+def _cached_result(task: Task, value: Any) -> Result:
+    return Result(host=task.host, result=value, cached=True)
+
+
+def cached(fact: str) -> Callable[..., Callable[..., Result]]:
+    """
+    Serves the result of a read-only task from FACTS if it's fresh, otherwise
+    runs the task and caches its result. Pass ``use_cache=False`` to the task
+    to force going to the device
+    """
+
+    def decorator(func: Callable[..., Result]) -> Callable[..., Result]:
+        @functools.wraps(func)
+        def wrapper(task: Task, use_cache: bool = True, **kwargs: Any) -> Result:
+            if use_cache:
+                value = FACTS.get(task.host.name, fact)
+                if value is not None:
+                    return _cached_result(task, value)
+            r = func(task, **kwargs)
+            if not r.failed:
+                FACTS.set(task.host.name, fact, r.result)
+            return r
+
+        return wrapper
+
+    return decorator
+
+
+def async_cached(fact: str) -> Callable[..., Callable[..., Awaitable[Result]]]:
+    """
+    Same as ``cached`` for async tasks
+    """
+
+    def decorator(
+        func: Callable[..., Awaitable[Result]]
+    ) -> Callable[..., Awaitable[Result]]:
+        @functools.wraps(func)
+        async def wrapper(task: Task, use_cache: bool = True, **kwargs: Any) -> Result:
+            if use_cache:
+                value = FACTS.get(task.host.name, fact)
+                if value is not None:
+                    return _cached_result(task, value)
+            r = await func(task, **kwargs)
+            if not r.failed:
+                FACTS.set(task.host.name, fact, r.result)
+            return r
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,103 @@
+import asyncio
+import functools
+import random
+import time
+from typing import Any, Awaitable, Callable, Tuple, Type
+
+from nornir.core.task import Result, Task
+
+from nornir3_demo.ext.acmeos import ConnectionException
+
+
+TaskFunction = Callable[..., Result]
+AsyncTaskFunction = Callable[..., Awaitable[Result]]
+
+
+def backoff(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Exponential backoff with full jitter so hosts retrying at the same
+    time don't hit the devices again in lockstep
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def _result(task: Task, r: Any, attempts: int) -> Result:
+    if not isinstance(r, Result):
+        r = Result(host=task.host, result=r)
+    # the runners and processors use this to report the retries
+    r.attempts = attempts
+    return r
+
+
+def _give_up(task: Task, exc: Exception, attempts: int) -> Result:
+    return Result(
+        host=task.host,
+        result=f"giving up after {attempts} attempts: {exc}",
+        exception=exc,
+        failed=True,
+        attempts=attempts,
+    )
+
+
+def retry(
+    attempts: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 5.0,
+    exceptions: Tuple[Type[Exception], ...] = (ConnectionException,),
+) -> Callable[[TaskFunction], TaskFunction]:
+    """
+    Retries the task when it raises one of the given exceptions. Only use it
+    with idempotent tasks, a task that changes the device might have done so
+    before failing.
+
+    The number of attempts is stored in the ``attempts`` attribute of the result
+
+    Arguments:
+        attempts: maximum number of times we run the task
+        base_delay: seconds to wait before the first retry, doubles on each retry
+        max_delay: maximum seconds to wait between retries
+        exceptions: exceptions we consider transient
+    """
+
+    def decorator(func: TaskFunction) -> TaskFunction:
+        @functools.wraps(func)
+        def wrapper(task: Task, **kwargs: Any) -> Result:
+            for attempt in range(attempts):
+                try:
+                    return _result(task, func(task, **kwargs), attempt + 1)
+                except exceptions as e:
+                    if attempt + 1 == attempts:
+                        return _give_up(task, e, attempts)
+                    time.sleep(backoff(attempt, base_delay, max_delay))
+            raise ValueError("attempts has to be >= 1")
+
+        return wrapper
+
+    return decorator
+
+
+def async_retry(
+    attempts: int = 3,
+    base_delay: float = 0.5,
+    max_delay: float = 5.0,
+    exceptions: Tuple[Type[Exception], ...] = (ConnectionException,),
+) -> Callable[[AsyncTaskFunction], AsyncTaskFunction]:
+    """
+    Same as ``retry`` for async tasks
+    """
+
+    def decorator(func: AsyncTaskFunction) -> AsyncTaskFunction:
+        @functools.wraps(func)
+        async def wrapper(task: Task, **kwargs: Any) -> Result:
+            for attempt in range(attempts):
+                try:
+                    return _result(task, await func(task, **kwargs), attempt + 1)
+                except exceptions as e:
+                    if attempt + 1 == attempts:
+                        return _give_up(task, e, attempts)
+                    await asyncio.sleep(backoff(attempt, base_delay, max_delay))
+            raise ValueError("attempts has to be >= 1")
+
+        return wrapper
+
+    return decorator